@@ -0,0 +1,210 @@
+"""Dense all-pairs distance and next-hop tables for fixed maps.
+
+After a one-off build, a query is a walk along the next-hop matrix,
+O(path length). Small graphs use a blocked, NumPy-vectorized
+Floyd-Warshall. Larger sparse graphs repeat single-source Dijkstra per row.
+"""
+from typing import List, Tuple
+
+import numpy as np
+
+from csr_graph import CSRGraph, INF
+
+DEFAULT_MEMORY_BUDGET = 256 * 2 ** 20
+# Above this many nodes Floyd-Warshall's O(n^3) loses to n Dijkstra runs on
+# campus-like sparse graphs
+FLOYD_WARSHALL_MAX_NODES = 1500
+# Rows processed per vectorized step; bounds the temporary buffers
+ROW_BLOCK = 256
+
+
+class MemoryBudgetError(MemoryError):
+    pass
+
+
+def estimate_bytes(node_count: int, method: str = "floyd-warshall") -> int:
+    # float32 distances + int32 next hops
+    tables = node_count * node_count * 8
+    if method == "floyd-warshall":
+        # candidate distances (float32) plus the improvement mask per row block
+        workspace = min(ROW_BLOCK, node_count) * node_count * 5
+    else:
+        # one Dijkstra row: Python float list, parent array and hop array
+        workspace = node_count * 32
+    return tables + workspace
+
+
+class AllPairsTable:
+    def __init__(self, csr: CSRGraph, dist: np.ndarray, next_hop: np.ndarray,
+                 memory_budget: int = DEFAULT_MEMORY_BUDGET):
+        self.csr = csr
+        self.dist = dist
+        # next_hop[s, t] is the node after s on a shortest s -> t route,
+        # t itself for a direct edge, s when s == t and -1 when unreachable
+        self.next_hop = next_hop
+        self.memory_budget = memory_budget
+        # Matrix entries compared / rewritten by the most recent insert_edge
+        self.last_examined = 0
+        self.last_touched = 0
+
+    @property
+    def node_count(self) -> int:
+        return len(self.dist)
+
+    @classmethod
+    def choose_method(cls, csr: CSRGraph) -> str:
+        return "floyd-warshall" if csr.node_count <= FLOYD_WARSHALL_MAX_NODES else "dijkstra"
+
+    @classmethod
+    def build(cls, csr: CSRGraph, memory_budget: int = DEFAULT_MEMORY_BUDGET,
+              method: str = "auto") -> "AllPairsTable":
+        if method == "auto":
+            method = cls.choose_method(csr)
+        if method not in ("floyd-warshall", "dijkstra"):
+            raise ValueError(f"Unknown all-pairs method: {method}")
+        needed = estimate_bytes(csr.node_count, method)
+        if needed > memory_budget:
+            raise MemoryBudgetError(
+                f"All-pairs tables for {csr.node_count} nodes need {needed / 2 ** 20:.1f} MiB, "
+                f"budget is {memory_budget / 2 ** 20:.1f} MiB")
+        if method == "floyd-warshall":
+            dist, next_hop = _floyd_warshall(csr)
+        else:
+            dist, next_hop = _repeated_dijkstra(csr)
+        return cls(csr, dist, next_hop, memory_budget)
+
+    def grow(self, node_count: int) -> None:
+        """Extend the tables with isolated nodes up to node_count."""
+        n = self.node_count
+        if node_count <= n:
+            return
+        needed = estimate_bytes(node_count, "dijkstra")
+        if needed > self.memory_budget:
+            raise MemoryBudgetError(
+                f"All-pairs tables for {node_count} nodes need {needed / 2 ** 20:.1f} MiB, "
+                f"budget is {self.memory_budget / 2 ** 20:.1f} MiB")
+        extra = node_count - n
+        self.dist = np.pad(self.dist, ((0, extra), (0, extra)), constant_values=np.inf)
+        self.next_hop = np.pad(self.next_hop, ((0, extra), (0, extra)), constant_values=-1)
+        added = np.arange(n, node_count)
+        self.dist[added, added] = 0.0
+        self.next_hop[added, added] = added
+
+    def insert_edge(self, u: int, v: int, weight: float) -> int:
+        """Repair the tables after edge u-v is inserted or made cheaper.
+
+        Only sources whose distance to one endpoint improves through the new
+        edge, crossed with targets whose distance from the other endpoint
+        improves, can change. Just that submatrix is examined. Returns the
+        number of entries rewritten; a weight increase is not handled here and
+        needs a rebuild.
+        """
+        dist, next_hop = self.dist, self.next_hop
+        w = np.float32(weight)
+        # Snapshot the endpoint rows/columns so both directions see the
+        # pre-insert distances, as a shortest route crosses the edge at most once
+        to_u, to_v = dist[:, u].copy(), dist[:, v].copy()
+        from_u, from_v = dist[u, :].copy(), dist[v, :].copy()
+        hop_to_u, hop_to_v = next_hop[:, u].copy(), next_hop[:, v].copy()
+
+        examined = touched = 0
+        for a, b, to_a, to_b, from_a, from_b, hop_to_a in (
+                (u, v, to_u, to_v, from_u, from_v, hop_to_u),
+                (v, u, to_v, to_u, from_v, from_u, hop_to_v)):
+            rows = np.flatnonzero(to_a + w < to_b)
+            cols = np.flatnonzero(from_b + w < from_a)
+            if not len(rows) or not len(cols):
+                continue
+            block = np.ix_(rows, cols)
+            candidate = (to_a[rows] + w)[:, None] + from_b[cols][None, :]
+            better = candidate < dist[block]
+            examined += better.size
+            if not better.any():
+                continue
+            first_hop = np.where(rows == a, b, hop_to_a[rows]).astype(np.int32)
+            dist[block] = np.where(better, candidate, dist[block])
+            next_hop[block] = np.where(better, first_hop[:, None], next_hop[block])
+            touched += int(np.count_nonzero(better))
+        self.last_examined = examined
+        self.last_touched = touched
+        return touched
+
+    def path(self, source: int, target: int) -> Tuple[List[int], float]:
+        """Reconstruct (path, cost) from the next-hop matrix; ([], inf) if unreachable."""
+        if self.next_hop[source, target] < 0:
+            return [], INF
+        row = self.next_hop[:, target]
+        path = [source]
+        cost = 0.0
+        while path[-1] != target:
+            if len(path) > len(row):
+                # Zero-weight ties between independently built rows can cycle
+                return self.csr.shortest_path(source, target)
+            hop = int(row[path[-1]])
+            # Sum float64 edge weights so costs match the other engines exactly
+            cost += self.csr.edge_weight(path[-1], hop)
+            path.append(hop)
+        return path, cost
+
+
+def _initial_tables(csr: CSRGraph):
+    n = csr.node_count
+    dist = np.full((n, n), np.inf, dtype=np.float32)
+    next_hop = np.full((n, n), -1, dtype=np.int32)
+    sources = np.repeat(np.arange(n), np.diff(csr.offsets))
+    # Parallel edges: keep the lightest by writing heaviest first
+    order = np.argsort(-csr.weights, kind="stable")
+    dist[sources[order], csr.neighbors[order]] = csr.weights[order]
+    next_hop[sources, csr.neighbors] = csr.neighbors
+    diagonal = np.arange(n)
+    dist[diagonal, diagonal] = 0.0
+    next_hop[diagonal, diagonal] = diagonal
+    return dist, next_hop
+
+
+def _floyd_warshall(csr: CSRGraph):
+    dist, next_hop = _initial_tables(csr)
+    n = csr.node_count
+    block = min(ROW_BLOCK, n)
+    candidate = np.empty((block, n), dtype=np.float32)
+    better = np.empty((block, n), dtype=bool)
+    for k in range(n):
+        through_k = dist[k]
+        for r0 in range(0, n, block):
+            r1 = min(r0 + block, n)
+            rows = dist[r0:r1]
+            cand = candidate[:r1 - r0]
+            mask = better[:r1 - r0]
+            np.add(rows[:, k:k + 1], through_k, out=cand)
+            np.less(cand, rows, out=mask)
+            np.copyto(rows, cand, where=mask)
+            hops = next_hop[r0:r1]
+            np.copyto(hops, hops[:, k:k + 1], where=mask)
+    return dist, next_hop
+
+
+def _repeated_dijkstra(csr: CSRGraph):
+    n = csr.node_count
+    dist = np.full((n, n), np.inf, dtype=np.float32)
+    next_hop = np.full((n, n), -1, dtype=np.int32)
+    nodes = np.arange(n, dtype=np.int32)
+    for s in range(n):
+        row, previous = csr.single_source(s)
+        dist[s] = row
+        parent = nodes.copy()
+        if previous:
+            parent[np.fromiter(previous.keys(), dtype=np.int32, count=len(previous))] = \
+                np.fromiter(previous.values(), dtype=np.int32, count=len(previous))
+        # Nodes whose parent is s are their own first hop; every other reached
+        # node inherits its parent's. Pointer doubling resolves the whole tree
+        # in O(log depth) vectorized passes.
+        hop = np.where(parent == s, nodes, parent)
+        hop[s] = s
+        while True:
+            jumped = hop[hop]
+            if np.array_equal(jumped, hop):
+                break
+            hop = jumped
+        reached = np.isfinite(dist[s])
+        next_hop[s, reached] = hop[reached]
+    return dist, next_hop
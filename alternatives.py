@@ -0,0 +1,106 @@
+"""Alternative routes: exact k shortest loopless paths, or cheaper penalty routes.
+
+Both start with one Dijkstra rooted at the target. On an undirected graph
+that gives every node's exact distance to the target, and its predecessor
+links are a shortest-path tree: the best route is read straight off it. The
+same distances then serve as the A* heuristic for every later search. They
+stay admissible when edges are banned or penalized, so those searches
+expand little beyond the route they return.
+
+Yen's algorithm (with Lawler's rule of only spurring at or after the
+node where a route left its parent) is exact. The penalty method makes
+already-used edges more expensive and searches again: it is a fixed k
+searches, but can miss or repeat routes.
+"""
+import heapq
+from typing import Dict, List, Optional, Tuple
+
+from csr_graph import CSRGraph, EdgeCosts, INF, Progress
+
+# Each time an edge is used, its weight is multiplied by 1 + PENALTY
+PENALTY = 0.5
+# The penalty method gives up after this many searches per route asked for
+PENALTY_ATTEMPTS = 3
+
+Path = Tuple[List[int], float]
+
+
+def reverse_tree(csr: CSRGraph, target: int, progress: Progress = None,
+                 costs: Optional[EdgeCosts] = None):
+    """(distance to target per node, first route from source) for a target."""
+    dist, next_hop = csr.single_source(target, progress=progress, costs=costs)
+
+    def route_from(source: int) -> List[int]:
+        if dist[source] == INF:
+            return []
+        path = [source]
+        while path[-1] != target:
+            path.append(next_hop[path[-1]])
+        return path
+
+    return dist, route_from
+
+
+def k_shortest_paths(csr: CSRGraph, source: int, target: int, k: int,
+                     progress: Progress = None, costs: Optional[EdgeCosts] = None) -> List[Path]:
+    """Up to k loopless routes in increasing cost (Yen)."""
+    heuristic, route_from = reverse_tree(csr, target, progress, costs)
+    first = route_from(source)
+    if not first:
+        return []
+    # Accepted routes as (path, cost, prefix costs, deviation index)
+    accepted = [(first, heuristic[source], _prefix_costs(csr, first, costs), 0)]
+    candidates: List[Tuple[float, List[int], int]] = []
+    seen = {tuple(first)}
+
+    while len(accepted) < k:
+        path, _, prefix, deviation = accepted[-1]
+        for i in range(deviation, len(path) - 1):
+            spur, root = path[i], path[:i + 1]
+            banned_slots = set()
+            for other, *_ in accepted:
+                if other[:i + 1] == root and len(other) > i + 1:
+                    banned_slots.update(csr.edge_slots(spur, other[i + 1]))
+            spur_path, spur_cost = csr.guided_path(spur, target, heuristic, frozenset(root[:-1]),
+                                                   banned_slots, progress=progress, costs=costs)
+            if not spur_path:
+                continue
+            candidate = root[:-1] + spur_path
+            key = tuple(candidate)
+            if key not in seen:
+                seen.add(key)
+                heapq.heappush(candidates, (prefix[i] + spur_cost, candidate, i))
+        if not candidates:
+            break
+        cost, candidate, deviation = heapq.heappop(candidates)
+        accepted.append((candidate, cost, _prefix_costs(csr, candidate, costs), deviation))
+    return [(path, cost) for path, cost, _, _ in accepted]
+
+
+def penalty_paths(csr: CSRGraph, source: int, target: int, k: int, penalty: float = PENALTY,
+                  progress: Progress = None, costs: Optional[EdgeCosts] = None) -> List[Path]:
+    """Up to k distinct routes, each found after penalizing the edges of the last."""
+    heuristic, route_from = reverse_tree(csr, target, progress, costs)
+    path = route_from(source)
+    if not path:
+        return []
+    found = {tuple(path): heuristic[source]}
+    penalties: Dict[int, float] = {}
+    for _ in range(k * PENALTY_ATTEMPTS):
+        if len(found) >= k:
+            break
+        for u, v in zip(path, path[1:]):
+            # Both directions, so the way back is not favoured either
+            for e in csr.edge_slots(u, v) + csr.edge_slots(v, u):
+                penalties[e] = penalties.get(e, 1.0) * (1.0 + penalty)
+        path, _ = csr.guided_path(source, target, heuristic, penalties=penalties,
+                                  progress=progress, costs=costs)
+        found.setdefault(tuple(path), csr.path_cost(path, costs))
+    return sorted(((list(path), cost) for path, cost in found.items()), key=lambda route: route[1])
+
+
+def _prefix_costs(csr: CSRGraph, path: List[int], costs: Optional[EdgeCosts] = None) -> List[float]:
+    prefix = [0.0]
+    for u, v in zip(path, path[1:]):
+        prefix.append(prefix[-1] + csr.edge_weight(u, v, costs))
+    return prefix
@@ -0,0 +1,190 @@
+"""Answer large files of origin/destination pairs from the command line.
+
+    python batch_routes.py --map campus.pfmap pairs.csv -o routes.csv
+
+Input is CSV (origin,destination columns, optional header) or JSONL
+({"origin": ..., "destination": ...} per line), read as a stream in
+fixed-size chunks so memory stays bounded whatever the file size. Within a
+chunk, pairs are grouped by origin, and one single-source Dijkstra answers
+every destination of that origin. Results are written in input order.
+"""
+import argparse
+import csv
+import json
+import sys
+import time
+from collections import defaultdict
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import mapfile
+from csr_graph import CSRGraph, EdgeCosts, INF
+
+DEFAULT_CHUNK_SIZE = 10000
+PATH_SEPARATOR = " > "
+
+Pair = Tuple[str, str]
+# (path, cost, error); path is None whenever error is set
+Result = Tuple[Optional[List[str]], float, Optional[str]]
+
+
+def routes_from_source(csr: CSRGraph, source: int, targets: Iterable[int],
+                       costs: Optional[EdgeCosts] = None) -> Dict[int, Tuple[List[int], float]]:
+    """One early-terminating Dijkstra answering every target of a source."""
+    targets = set(targets)
+    dist, previous = csr.single_source(source, targets, costs=costs)
+    answers = {}
+    for target in targets:
+        if dist[target] == INF:
+            answers[target] = ([], INF)
+        else:
+            answers[target] = (csr.unwind(previous, source, target), dist[target])
+    return answers
+
+
+def route_pairs(csr: CSRGraph, pairs: Sequence[Pair], costs: Optional[EdgeCosts] = None) -> List[Result]:
+    results: List[Optional[Result]] = [None] * len(pairs)
+    by_source: Dict[int, List[Tuple[int, int]]] = defaultdict(list)
+    for position, (origin, destination) in enumerate(pairs):
+        source, target = csr.index.get(origin), csr.index.get(destination)
+        if source is None or target is None:
+            missing = origin if source is None else destination
+            results[position] = (None, INF, f"Unknown location: {missing}")
+        else:
+            by_source[source].append((position, target))
+
+    for source, wanted in by_source.items():
+        answers = routes_from_source(csr, source, (target for _, target in wanted), costs)
+        for position, target in wanted:
+            ids, cost = answers[target]
+            if ids:
+                results[position] = ([csr.names[i] for i in ids], cost, None)
+            else:
+                origin, destination = pairs[position]
+                results[position] = (None, INF, f"No route between {origin} and {destination}")
+    return results
+
+
+def read_pairs(stream, fmt: str) -> Iterator[Pair]:
+    if fmt == "jsonl":
+        for line_number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+                yield str(record["origin"]), str(record["destination"])
+            except (ValueError, KeyError, TypeError) as exc:
+                raise ValueError(f"Line {line_number}: expected an origin/destination object ({exc})") from None
+        return
+
+    rows = csv.reader(stream)
+    for row_number, row in enumerate(rows, 1):
+        if not row:
+            continue
+        if row_number == 1 and [cell.strip().lower() for cell in row[:2]] == ["origin", "destination"]:
+            continue
+        if len(row) < 2:
+            raise ValueError(f"Row {row_number}: expected origin,destination")
+        yield row[0], row[1]
+
+
+class ResultWriter:
+    def __init__(self, stream, fmt: str):
+        self.stream = stream
+        self.fmt = fmt
+        if fmt == "csv":
+            self._csv = csv.writer(stream)
+            self._csv.writerow(["origin", "destination", "cost", "path", "error"])
+
+    def write(self, pair: Pair, result: Result) -> None:
+        (origin, destination), (path, cost, error) = pair, result
+        if self.fmt == "jsonl":
+            record = {"origin": origin, "destination": destination}
+            if error:
+                record["error"] = error
+            else:
+                record.update(cost=cost, path=path)
+            self.stream.write(json.dumps(record, ensure_ascii=False) + "\n")
+        else:
+            self._csv.writerow([origin, destination, "" if error else repr(cost),
+                                "" if error else PATH_SEPARATOR.join(path), error or ""])
+
+
+def chunked(iterable, size: int) -> Iterator[list]:
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def guess_format(filename: str, default: str = "csv") -> str:
+    if filename.endswith((".jsonl", ".ndjson", ".json")):
+        return "jsonl"
+    if filename.endswith(".csv"):
+        return "csv"
+    return default
+
+
+def run(csr: CSRGraph, source, sink, input_format: str, output_format: str,
+        chunk_size: int = DEFAULT_CHUNK_SIZE, solve=route_pairs) -> Tuple[int, float]:
+    """Stream pairs from source to sink; returns (queries answered, seconds)."""
+    writer = ResultWriter(sink, output_format)
+    answered = 0
+    started = time.perf_counter()
+    for chunk in chunked(read_pairs(source, input_format), chunk_size):
+        for pair, result in zip(chunk, solve(csr, chunk)):
+            writer.write(pair, result)
+        answered += len(chunk)
+    return answered, time.perf_counter() - started
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Answer origin/destination pairs in bulk.")
+    parser.add_argument("input", help="CSV or JSONL file of pairs, or - for stdin")
+    parser.add_argument("--map", required=True, help="map file written by Save Map (.pfmap)")
+    parser.add_argument("-o", "--output", default="-", help="result file, or - for stdout")
+    parser.add_argument("--input-format", choices=["csv", "jsonl"])
+    parser.add_argument("--output-format", choices=["csv", "jsonl"])
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="pairs held in memory at once (default %(default)s)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="worker processes sharing the graph; 0 means one per core")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    input_format = args.input_format or guess_format(args.input)
+    output_format = args.output_format or guess_format(args.output, input_format)
+    try:
+        csr = mapfile.load_map(args.map).frozen()
+    except (OSError, mapfile.MapFormatError) as exc:
+        sys.exit(f"Could not load map: {exc}")
+
+    source = sys.stdin if args.input == "-" else open(args.input, newline="", encoding="utf-8")
+    sink = sys.stdout if args.output == "-" else open(args.output, "w", newline="", encoding="utf-8")
+    pool = None
+    solve = route_pairs
+    if args.workers != 1:
+        from parallel_routes import ParallelRouter
+        pool = ParallelRouter(csr, args.workers or None)
+        solve = lambda _, pairs: pool.route_pairs(pairs)
+    try:
+        answered, elapsed = run(csr, source, sink, input_format, output_format, args.chunk_size, solve)
+    except ValueError as exc:
+        sys.exit(f"Bad input: {exc}")
+    finally:
+        if pool is not None:
+            pool.close()
+        if source is not sys.stdin:
+            source.close()
+        if sink is not sys.stdout:
+            sink.close()
+    rate = answered / elapsed if elapsed > 0 else float("inf")
+    print(f"Answered {answered} queries in {elapsed:.2f} s ({rate:.0f} queries/s)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+"""Benchmark routing engines and map rendering on synthetic maps.
+
+    python benchmark.py --maps grid clustered --sizes 1000 100000 -o bench.json
+
+For every generated map and engine, a fixed seeded set of origin/destination
+pairs is routed one at a time. The JSON report holds p50/p99 latency,
+queries per second, preprocessing time and peak memory per case, plus
+enough environment detail to compare runs across machines.
+
+Peak memory per case (traced_peak_mb) is the tracemalloc high-water mark
+during a second, traced run of the case. Tracing slows searches down many
+times over, so the timings always come from the first, untraced run. Pass
+--no-trace-memory to skip the traced run. The report's memory_mode says
+which was done. The process-wide RSS high-water mark only ever grows from
+case to case, so it is reported once for the whole run
+(process_peak_rss_mb), not per case.
+
+Engines:
+    networkx   nx.dijkstra_path + nx.path_weight, as the apps originally did
+    dijkstra   RoutingEngine, CSR Dijkstra
+    astar      RoutingEngine, CSR A*
+    ch         RoutingEngine over a contraction hierarchy
+    table      RoutingEngine over precomputed all-pairs tables
+    render     static map draw plus route overlay blit, on the Agg backend
+"""
+import argparse
+import gc
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from typing import Dict, List, Optional
+
+import numpy as np
+
+import synthetic_maps
+from all_pairs import MemoryBudgetError
+from routing import NoRouteError, RoutingEngine
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+ENGINES = ("networkx", "dijkstra", "astar", "ch", "table", "render")
+DEFAULT_ENGINES = ("networkx", "dijkstra", "astar", "ch", "table")
+DEFAULT_SIZES = (10, 100, 1000, 10000)
+# Cases above these node counts take hours in pure Python and are skipped
+# unless --no-limits is given
+NODE_LIMITS = {"ch": 200000, "render": 200000}
+RENDER_REPEATS = 3
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {}
+    ms = np.asarray(samples) * 1000.0
+    return {"p50_ms": float(np.percentile(ms, 50)), "p99_ms": float(np.percentile(ms, 99)),
+            "mean_ms": float(ms.mean()), "max_ms": float(ms.max())}
+
+
+def peak_rss_mb() -> Optional[float]:
+    # High-water mark of the whole process, so it only ever grows across cases
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+
+def time_queries(route, pairs) -> Dict:
+    samples, failures = [], 0
+    for start, end in pairs:
+        began = time.perf_counter()
+        try:
+            route(start, end)
+        except NoRouteError:
+            failures += 1
+        samples.append(time.perf_counter() - began)
+    total = sum(samples)
+    return dict(percentiles(samples), queries=len(pairs), failures=failures,
+                qps=len(pairs) / total if total > 0 else None)
+
+
+def networkx_case(csr, pairs) -> Dict:
+    import networkx as nx
+    began = time.perf_counter()
+    graph = nx.Graph()
+    graph.add_nodes_from(csr.names)
+    graph.add_weighted_edges_from(RoutingEngine.from_csr(csr).edges())
+    prepared = time.perf_counter() - began
+
+    def route(start, end):
+        try:
+            path = nx.dijkstra_path(graph, start, end, weight='weight')
+        except nx.NetworkXNoPath:
+            raise NoRouteError(start, end) from None
+        return path, nx.path_weight(graph, path, weight='weight')
+
+    return dict(time_queries(route, pairs), preprocess_s=prepared)
+
+
+def engine_case(csr, pairs, method) -> Dict:
+    # No route cache: every query must do its own search
+    engine = RoutingEngine.from_csr(csr, cache_size=0)
+    began = time.perf_counter()
+    if method == "ch":
+        engine.build_hierarchy()
+    elif method == "table":
+        engine.precompute_all_pairs()
+    prepared = time.perf_counter() - began
+    result = dict(time_queries(lambda s, t: engine.route(s, t, method), pairs), preprocess_s=prepared)
+    if method == "ch":
+        result["shortcuts"] = engine.hierarchy.shortcut_count
+    return result
+
+
+def render_case(csr, pairs) -> Dict:
+    import matplotlib
+    matplotlib.use("Agg")
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.collections import LineCollection
+    from matplotlib.figure import Figure
+    from map_renderer import draw_network
+
+    engine = RoutingEngine.from_csr(csr)
+    edges = list(engine.edges())
+    positions = engine.positions
+    figure = Figure(figsize=(10, 8), dpi=100)
+    canvas = FigureCanvasAgg(figure)
+    ax = figure.add_subplot()
+
+    static = []
+    for _ in range(RENDER_REPEATS):
+        ax.clear()
+        began = time.perf_counter()
+        draw_network(ax, csr.names, positions, edges, node_style=dict(s=20), edge_style=dict(colors='black'),
+                     label_style=dict(fontsize=8))
+        canvas.draw()
+        static.append(time.perf_counter() - began)
+
+    # Per query the apps only blit the route over a cached background
+    background = canvas.copy_from_bbox(figure.bbox)
+    overlay = LineCollection([], colors='red', animated=True)
+    ax.add_collection(overlay)
+    blits = []
+    for start, end in pairs:
+        try:
+            path, _ = engine.route(start, end)
+        except NoRouteError:
+            continue
+        began = time.perf_counter()
+        canvas.restore_region(background)
+        overlay.set_segments([[positions[node] for node in path]])
+        ax.draw_artist(overlay)
+        canvas.blit(figure.bbox)
+        blits.append(time.perf_counter() - began)
+
+    return dict({f"static_{key}": value for key, value in percentiles(static).items()},
+                **percentiles(blits), queries=len(blits),
+                qps=len(blits) / sum(blits) if sum(blits) > 0 else None)
+
+
+def run_case(engine: str, csr, pairs) -> Dict:
+    if engine == "networkx":
+        return networkx_case(csr, pairs)
+    if engine == "render":
+        return render_case(csr, pairs)
+    return engine_case(csr, pairs, engine)
+
+
+def traced_peak_mb(engine: str, csr, pairs) -> float:
+    # Run the case again under tracemalloc; its timings are thrown away
+    gc.collect()
+    tracemalloc.start()
+    try:
+        run_case(engine, csr, pairs)
+        return tracemalloc.get_traced_memory()[1] / 1024 ** 2
+    finally:
+        tracemalloc.stop()
+
+
+def environment() -> Dict:
+    info = {"python": platform.python_version(), "platform": platform.platform(),
+            "processor": platform.processor(), "numpy": np.__version__}
+    for module in ("networkx", "matplotlib"):
+        try:
+            info[module] = __import__(module).__version__
+        except ImportError:
+            pass
+    return info
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Benchmark routing and rendering on synthetic maps.")
+    parser.add_argument("--maps", nargs="+", choices=sorted(synthetic_maps.GENERATORS),
+                        default=sorted(synthetic_maps.GENERATORS))
+    parser.add_argument("--sizes", nargs="+", type=int, default=list(DEFAULT_SIZES),
+                        help=f"node counts (default %(default)s; up to {max(synthetic_maps.SIZES):,} supported)")
+    parser.add_argument("--engines", nargs="+", choices=ENGINES, default=list(DEFAULT_ENGINES))
+    parser.add_argument("--queries", type=int, default=200, help="routed pairs per case")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-trace-memory", dest="trace_memory", action="store_false",
+                        help="skip the traced second run of each case that measures its peak memory")
+    parser.add_argument("--no-limits", action="store_true", help=f"ignore the size limits {NODE_LIMITS}")
+    parser.add_argument("-o", "--output", default="benchmark.json")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    report = {"started": time.strftime("%Y-%m-%dT%H:%M:%S%z"), "seed": args.seed,
+              "queries": args.queries, "environment": environment(),
+              "memory_mode": "separate traced run" if args.trace_memory else "not traced",
+              "results": []}
+
+    for kind in args.maps:
+        for size in args.sizes:
+            began = time.perf_counter()
+            csr = synthetic_maps.generate(kind, size, args.seed)
+            generated = time.perf_counter() - began
+            pairs = synthetic_maps.random_pairs(csr, args.queries, args.seed)
+            for engine in args.engines:
+                case = {"map": kind, "nodes": csr.node_count, "edges": csr.edge_count,
+                        "engine": engine, "generate_s": generated}
+                limit = NODE_LIMITS.get(engine)
+                if limit is not None and size > limit and not args.no_limits:
+                    case["skipped"] = f"over the {limit:,}-node limit"
+                else:
+                    gc.collect()
+                    try:
+                        case.update(run_case(engine, csr, pairs))
+                        if args.trace_memory:
+                            case["traced_peak_mb"] = traced_peak_mb(engine, csr, pairs)
+                    except MemoryBudgetError as exc:
+                        case["skipped"] = str(exc)
+                report["results"].append(case)
+                print(summary(case), file=sys.stderr)
+
+    report["process_peak_rss_mb"] = peak_rss_mb()
+    with open(args.output, "w", encoding="utf-8") as handle:
+        json.dump(report, handle, indent=2)
+    print(f"Wrote {len(report['results'])} results to {args.output}", file=sys.stderr)
+
+
+def summary(case: Dict) -> str:
+    label = f"{case['map']:>9} {case['nodes']:>8,} {case['engine']:>8}"
+    if "skipped" in case:
+        return f"{label}  skipped: {case['skipped']}"
+    if "p50_ms" not in case:
+        return f"{label}  no routable pairs"
+    qps = f"{case['qps']:10.1f}" if case.get("qps") is not None else f"{'-':>10}"
+    line = f"{label}  p50 {case['p50_ms']:8.3f} ms  p99 {case['p99_ms']:8.3f} ms  {qps} q/s"
+    if "traced_peak_mb" in case:
+        line += f"  peak {case['traced_peak_mb']:8.1f} MB"
+    return line
+
+
+if __name__ == "__main__":
+    main()
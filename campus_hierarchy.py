@@ -0,0 +1,235 @@
+"""Campus maps whose buildings have their own indoor graphs.
+
+The campus level is an ordinary RoutingEngine of outdoor paths. Each
+building is a separate indoor graph of rooms, corridors, stairs and lifts
+over any number of floors. It meets the campus only at its portals: campus
+nodes, usually entrances, that stand for a node inside the building.
+
+The distances between a building's portals are computed once (or supplied
+precomputed) and added to the campus level as shortcut edges, so a route
+can cut through a building without its indoor graph being searched or even
+loaded. A query then searches only the start building (room to each of its
+portals), the end building (each portal to the room) and the campus level
+seeded with the start distances. Indoor graphs are loaded on first use and
+only the most recently used few stay in memory.
+
+Indoor locations are (building, indoor node) pairs; anything else names a
+campus node.
+"""
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Sequence, Tuple
+
+from csr_graph import INF, Progress
+from instrumentation import metrics
+from routing import NoRouteError, Node, Route, RoutingEngine, UnknownLocationError
+
+# Indoor graphs kept in memory at once
+MAX_LOADED_BUILDINGS = 8
+
+Location = Hashable
+# Indoor route to or from a building's portals: {campus portal: (cost, indoor locations)}
+PortalLegs = Dict[Node, Tuple[float, List[Location]]]
+
+
+class Building:
+    def __init__(self, name: str, portals: Dict[Node, Node], load: Callable[[], RoutingEngine],
+                 portal_table: Optional[Dict[Tuple[Node, Node], float]] = None):
+        self.name = name
+        # Campus node -> the indoor node it stands for
+        self.portals = portals
+        # Called to build or read the indoor graph whenever it is needed
+        self.load = load
+        # Indoor distance between each ordered pair of connected portals
+        self.portal_table = portal_table
+
+
+def floor_plan(floors: Dict[Hashable, Iterable[Tuple[Node, Node, float]]],
+               shafts: Sequence[Tuple[Node, float]] = ()) -> RoutingEngine:
+    """Indoor graph over (floor, room) nodes from each floor's corridor edges.
+
+    Floors are stacked in the order given. Each shaft, (room, weight), is a
+    stairwell or lift: its room on every floor that has one is linked to
+    the same room on the next such floor.
+    """
+    engine = RoutingEngine()
+    for floor, corridors in floors.items():
+        for a, b, weight in corridors:
+            engine.add_edge((floor, a), (floor, b), weight)
+    for room, weight in shafts:
+        stops = [floor for floor in floors if engine.has_node((floor, room))]
+        for lower, upper in zip(stops, stops[1:]):
+            engine.add_edge((lower, room), (upper, room), weight)
+    return engine
+
+
+def label(location: Location) -> str:
+    """Readable name for a campus node or an indoor location."""
+    if isinstance(location, tuple) and len(location) == 2:
+        building, inner = location
+        if isinstance(inner, tuple) and len(inner) == 2:
+            return f"{inner[1]} ({building}, floor {inner[0]})"
+        return f"{inner} ({building})"
+    return str(location)
+
+
+class CampusHierarchy:
+    def __init__(self, campus: RoutingEngine, max_loaded: int = MAX_LOADED_BUILDINGS):
+        self.campus = campus
+        self.buildings: Dict[str, Building] = {}
+        self.max_loaded = max_loaded
+        self._loaded: "OrderedDict[str, RoutingEngine]" = OrderedDict()
+        # Room lists are read on the UI thread while routes load buildings on the worker
+        self._loaded_lock = threading.Lock()
+        # Campus plus portal shortcuts, rebuilt when the campus or buildings change
+        self._overlay: Optional[RoutingEngine] = None
+        self._overlay_of = None
+        # Portal pairs whose overlay edge runs through a building
+        self._shortcuts: Dict[Tuple[Node, Node], str] = {}
+
+    def add_building(self, building: Building) -> None:
+        for portal in building.portals:
+            if not self.campus.has_node(portal):
+                raise UnknownLocationError(portal)
+            for other in self.buildings.values():
+                if portal in other.portals:
+                    raise ValueError(f"{portal} is already a portal of {other.name}")
+        self.buildings[building.name] = building
+        self._overlay = None
+
+    def indoor(self, name: str) -> RoutingEngine:
+        """The building's indoor graph, loading it if it is not in memory."""
+        with self._loaded_lock:
+            engine = self._loaded.get(name)
+            if engine is not None:
+                self._loaded.move_to_end(name)
+                return engine
+        try:
+            building = self.buildings[name]
+        except KeyError:
+            raise UnknownLocationError(name) from None
+        # Loaded unlocked so a slow load does not hold up the other thread
+        with metrics.span("building_load"):
+            engine = building.load()
+        with self._loaded_lock:
+            # Another thread may have loaded it meanwhile; keep the first copy
+            engine = self._loaded.setdefault(name, engine)
+            self._loaded.move_to_end(name)
+            if len(self._loaded) > self.max_loaded:
+                self._loaded.popitem(last=False)
+        return engine
+
+    def rooms(self, name: str) -> List[Node]:
+        return self.indoor(name).nodes()
+
+    def portal_table(self, name: str) -> Dict[Tuple[Node, Node], float]:
+        building = self.buildings[name]
+        if building.portal_table is None and len(building.portals) < 2:
+            # Nothing to cross, so no reason to load the building
+            building.portal_table = {}
+        if building.portal_table is None:
+            portals = list(building.portals)
+            routes = self.indoor(name).route_matrix([building.portals[p] for p in portals])
+            building.portal_table = {(p, q): routes[building.portals[p], building.portals[q]][1]
+                                     for p in portals for q in portals
+                                     if p != q and (building.portals[p], building.portals[q]) in routes}
+        return building.portal_table
+
+    def precompute_portal_tables(self) -> None:
+        """Fill in every missing portal table, e.g. ahead of saving them."""
+        for name in self.buildings:
+            self.portal_table(name)
+
+    def overlay(self) -> RoutingEngine:
+        """The campus graph plus an edge for every way through a building."""
+        # The campus engine hands out a new snapshot after every edit
+        campus_csr = self.campus.frozen()
+        if self._overlay is None or self._overlay_of is not campus_csr:
+            overlay = RoutingEngine()
+            positions = self.campus.positions
+            for node in self.campus.nodes():
+                overlay.add_node(node, positions.get(node))
+            for u, v, weight in self.campus.edges():
+                overlay.add_edge(u, v, weight)
+            self._shortcuts = {}
+            for name in self.buildings:
+                for (p, q), cost in self.portal_table(name).items():
+                    if cost < overlay.neighbours(p).get(q, INF):
+                        overlay.add_edge(p, q, cost)
+                        self._shortcuts[p, q] = self._shortcuts[q, p] = name
+            self._overlay, self._overlay_of = overlay, campus_csr
+        return self._overlay
+
+    def through(self, u: Node, v: Node) -> Optional[str]:
+        """Building a route's u -> v step cuts through, or None for an outdoor path."""
+        return self._shortcuts.get((u, v))
+
+    def route(self, start: Location, end: Location, progress: Progress = None) -> Route:
+        """Shortest route between campus nodes and/or indoor locations.
+
+        The path lists indoor steps as (building, node) and campus steps by
+        name. A step between two portals of one building that goes through
+        it is not expanded; see through().
+        """
+        with metrics.capture("hierarchy_route"):
+            csr = self.overlay().frozen()
+            exits = self._portal_legs(start)
+            entries = self._portal_legs(end)
+            best: Route = ([], INF)
+            if self._building_of(start) is not None and self._building_of(start) == self._building_of(end):
+                best = self._indoor_route(start, end)
+
+            seeds = {csr.index[portal]: cost for portal, (cost, _) in exits.items()}
+            targets = {csr.index[portal] for portal in entries}
+            if seeds and targets:
+                dist, previous = csr.single_source(seeds, targets, progress)
+                metrics.count("nodes_settled", csr.last_settled)
+                arrival = min(entries, key=lambda portal: dist[csr.index[portal]] + entries[portal][0])
+                cost = dist[csr.index[arrival]] + entries[arrival][0]
+                if cost < best[1]:
+                    outdoor = [csr.names[i] for i in csr.unwind(previous, None, csr.index[arrival])]
+                    path = exits[outdoor[0]][1] + outdoor + entries[arrival][1][::-1]
+                    # A room that is itself a portal keeps the name it was asked for
+                    if len(path) > 1:
+                        path[0], path[-1] = start, end
+                    else:
+                        path = [start] if start == end else [start, end]
+                    best = path, cost
+            if not best[0]:
+                raise NoRouteError(label(start), label(end))
+            return best
+
+    def _building_of(self, location: Location) -> Optional[str]:
+        if isinstance(location, tuple) and len(location) == 2 and location[0] in self.buildings:
+            return location[0]
+        return None
+
+    def _portal_legs(self, location: Location) -> PortalLegs:
+        name = self._building_of(location)
+        if name is None:
+            if not self.campus.has_node(location):
+                raise UnknownLocationError(location)
+            return {location: (0.0, [])}
+        building, room = self.buildings[name], location[1]
+        indoor = self.indoor(name).frozen()
+        if room not in indoor.index:
+            raise UnknownLocationError(label(location))
+        source = indoor.index[room]
+        by_node = {indoor.index[inner]: portal for portal, inner in building.portals.items()
+                   if inner in indoor.index}
+        dist, previous = indoor.single_source(source, by_node)
+        legs = {}
+        for target, portal in by_node.items():
+            if dist[target] != INF:
+                # The portal itself is named on the campus side of the route
+                steps = indoor.unwind(previous, source, target)[:-1]
+                legs[portal] = dist[target], [(name, indoor.names[i]) for i in steps]
+        return legs
+
+    def _indoor_route(self, start: Location, end: Location) -> Route:
+        name = start[0]
+        try:
+            path, cost = self.indoor(name).route(start[1], end[1])
+        except NoRouteError:
+            return [], INF
+        return [(name, node) for node in path], cost
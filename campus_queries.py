@@ -0,0 +1,95 @@
+"""Category and multi-stop queries on top of RoutingEngine.
+
+"Closest dormitory" is one early-terminating Dijkstra towards every building
+of the category at once. "Tour through these stops" computes the pairwise
+route matrix once, orders the stops by nearest neighbour, and improves the
+order with 2-opt. That is a few searches however many orders are compared.
+"""
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from csr_graph import INF, Progress
+from routing import NoRouteError, Node, Route, RoutingEngine, RoutingError
+
+CATEGORIES = ("Academic", "Residential", "Support", "Other")
+
+
+def categorize_building(name: str) -> str:
+    if "Academic" in name or "Engineering" in name or "Science" in name:
+        return "Academic"
+    elif "Dormitory" in name:
+        return "Residential"
+    elif "Library" in name or "Student Center" in name:
+        return "Support"
+    else:
+        return "Other"
+
+
+def nearest_facility(engine: RoutingEngine, start: Node, category: str,
+                     progress: Progress = None, profile=None, departure: Optional[float] = None) -> Route:
+    """Route to the closest building of category other than start itself.
+
+    profile and departure are passed on to the engine, as for route().
+    """
+    candidates = [node for node in engine.nodes()
+                  if node != start and categorize_building(str(node)) == category]
+    if not candidates:
+        raise RoutingError(f"No other {category} buildings on this map")
+    try:
+        return engine.nearest(start, candidates, progress, profile, departure)
+    except NoRouteError:
+        raise NoRouteError(start, f"any {category} building") from None
+
+
+def plan_tour(engine: RoutingEngine, start: Node, stops: Sequence[Node], return_to_start: bool = False,
+              progress: Progress = None, profile=None,
+              departure: Optional[float] = None) -> Tuple[List[Node], Route]:
+    """Visit every stop from start in a short order.
+
+    Returns (stop order, (full path, cost)). The order starts with start and,
+    with return_to_start, the path ends there too.
+    """
+    order = [start] + [stop for stop in dict.fromkeys(stops) if stop != start]
+    routes = engine.route_matrix(order, progress, profile, departure)
+    for stop in order[1:]:
+        if (start, stop) not in routes:
+            raise NoRouteError(start, stop)
+    cost = {(a, b): routes[a, b][1] if (a, b) in routes else INF for a in order for b in order}
+
+    order = _nearest_neighbour(order, cost)
+    _two_opt(order, cost, return_to_start)
+    legs = list(zip(order, order[1:] + (order[:1] if return_to_start else [])))
+    path, total = [start], 0.0
+    for a, b in legs:
+        leg_path, leg_cost = routes[a, b]
+        path.extend(leg_path[1:])
+        total += leg_cost
+    return order, (path, total)
+
+
+def _nearest_neighbour(nodes: List[Node], cost: Dict[Tuple[Node, Node], float]) -> List[Node]:
+    order, remaining = nodes[:1], set(nodes[1:])
+    while remaining:
+        here = order[-1]
+        # Ties broken by input order so tours are reproducible
+        closest = min(remaining, key=lambda node: (cost[here, node], nodes.index(node)))
+        order.append(closest)
+        remaining.remove(closest)
+    return order
+
+
+def _two_opt(order: List[Node], cost: Dict[Tuple[Node, Node], float], closed: bool) -> None:
+    # Reversing order[i..j] swaps edges (a, b), (c, d) for (a, c), (b, d); the
+    # legs inside keep their cost because routes are undirected. The first
+    # stop is fixed, and an open tour has no edge after its last stop.
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, len(order) - 1):
+            for j in range(i + 1, len(order)):
+                a, b, c = order[i - 1], order[i], order[j]
+                d = order[j + 1] if j + 1 < len(order) else (order[0] if closed else None)
+                before = cost[a, b] + (cost[c, d] if d is not None else 0.0)
+                after = cost[a, c] + (cost[b, d] if d is not None else 0.0)
+                if after < before - 1e-9:
+                    order[i:j + 1] = order[i:j + 1][::-1]
+                    improved = True
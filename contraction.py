@@ -0,0 +1,237 @@
+"""Contraction Hierarchies over a frozen CSRGraph.
+
+Preprocessing contracts nodes in order of importance, adding shortcut edges
+so that shortest distances are preserved among the nodes left. Queries then
+run a bidirectional Dijkstra that only ever relaxes edges towards
+higher-ranked nodes. That search touches a few hundred nodes even on large
+maps. Shortcuts remember the node they bypass, so routes unpack back into
+the original node sequence.
+"""
+import hashlib
+import heapq
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from csr_graph import CSRGraph, INF, PROGRESS_INTERVAL, Progress
+
+FORMAT_VERSION = 1
+
+# Witness searches give up after settling this many nodes. A missed witness
+# only costs an unnecessary shortcut, never a wrong answer.
+WITNESS_SETTLE_LIMIT = 60
+
+
+def graph_fingerprint(csr: CSRGraph) -> str:
+    digest = hashlib.sha1()
+    for array in (csr.offsets, csr.neighbors, csr.weights):
+        digest.update(np.ascontiguousarray(array).data)
+    return digest.hexdigest()
+
+
+class ContractionHierarchy:
+    def __init__(self, rank: np.ndarray, up_offsets: np.ndarray, up_targets: np.ndarray,
+                 up_weights: np.ndarray, up_middle: np.ndarray, fingerprint: str):
+        self.rank = rank
+        # Upward graph in CSR form: each edge leads to a higher-ranked node.
+        # up_middle is -1 for an original edge, else the node the shortcut skips.
+        self.up_offsets = up_offsets
+        self.up_targets = up_targets
+        self.up_weights = up_weights
+        self.up_middle = up_middle
+        self.fingerprint = fingerprint
+        self.last_settled = 0
+
+        self._offsets = memoryview(up_offsets)
+        self._targets = memoryview(up_targets)
+        self._weights = memoryview(up_weights)
+        self._middle = memoryview(up_middle)
+        self._rank = memoryview(rank)
+
+    @property
+    def shortcut_count(self) -> int:
+        return int(np.count_nonzero(self.up_middle >= 0))
+
+    @classmethod
+    def build(cls, csr: CSRGraph) -> "ContractionHierarchy":
+        n = csr.node_count
+        # Remaining graph: node -> {neighbour: (weight, middle)}
+        remaining: List[Dict[int, Tuple[float, int]]] = [{} for _ in range(n)]
+        offsets, neighbors, weights = csr.offsets.tolist(), csr.neighbors.tolist(), csr.weights.tolist()
+        for u in range(n):
+            adjacent = remaining[u]
+            for e in range(offsets[u], offsets[u + 1]):
+                v, w = neighbors[e], weights[e]
+                if v != u and w < adjacent.get(v, (INF, -1))[0]:
+                    adjacent[v] = (w, -1)
+
+        contracted_neighbours = [0] * n
+        rank = [0] * n
+        upward: List[List[Tuple[int, float, int]]] = [[] for _ in range(n)]
+
+        heap = [(cls._priority(remaining, contracted_neighbours, v), v) for v in range(n)]
+        heapq.heapify(heap)
+        order = 0
+        while heap:
+            _, v = heapq.heappop(heap)
+            # Lazy update: re-evaluate and defer if v is no longer the cheapest
+            priority = cls._priority(remaining, contracted_neighbours, v)
+            if heap and priority > heap[0][0]:
+                heapq.heappush(heap, (priority, v))
+                continue
+
+            rank[v] = order
+            order += 1
+            for u, (w, middle) in remaining[v].items():
+                upward[v].append((u, w, middle))
+            for u, w, cost in cls._shortcuts(remaining, v):
+                if cost < remaining[u].get(w, (INF, -1))[0]:
+                    remaining[u][w] = (cost, v)
+                    remaining[w][u] = (cost, v)
+            for u in remaining[v]:
+                del remaining[u][v]
+                contracted_neighbours[u] += 1
+            remaining[v] = {}
+
+        up_offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum([len(edges) for edges in upward], out=up_offsets[1:])
+        flat = [edge for edges in upward for edge in edges]
+        up_targets = np.fromiter((edge[0] for edge in flat), dtype=np.int32, count=len(flat))
+        up_weights = np.fromiter((edge[1] for edge in flat), dtype=np.float64, count=len(flat))
+        up_middle = np.fromiter((edge[2] for edge in flat), dtype=np.int32, count=len(flat))
+        return cls(np.asarray(rank, dtype=np.int32), up_offsets, up_targets, up_weights,
+                   up_middle, graph_fingerprint(csr))
+
+    @classmethod
+    def _priority(cls, remaining, contracted_neighbours, v) -> int:
+        # Edge difference plus a uniformity term that spreads contraction evenly
+        shortcuts = sum(1 for _ in cls._shortcuts(remaining, v))
+        return shortcuts - len(remaining[v]) + contracted_neighbours[v]
+
+    @staticmethod
+    def _shortcuts(remaining, v):
+        """Yield (u, w, cost) for every neighbour pair that needs a shortcut over v."""
+        neighbours = list(remaining[v].items())
+        for i, (u, (wu, _)) in enumerate(neighbours):
+            targets = {w: wu + ww for w, (ww, _) in neighbours[i + 1:]}
+            if not targets:
+                continue
+            limit = max(targets.values())
+            witnessed = _witness_distances(remaining, u, v, targets, limit)
+            for w, via_v in targets.items():
+                if witnessed.get(w, INF) > via_v:
+                    yield u, w, via_v
+
+    def query(self, source: int, target: int, progress: Progress = None) -> Tuple[List[int], float]:
+        """Bidirectional upward search; returns ([], inf) when unreachable."""
+        if source == target:
+            return [source], 0.0
+        offsets, targets, weights = self._offsets, self._targets, self._weights
+        dist = ({source: 0.0}, {target: 0.0})
+        previous = ({}, {})
+        heaps = ([(0.0, source)], [(0.0, target)])
+        best, meeting = INF, -1
+        settled = 0
+        pop, push = heapq.heappop, heapq.heappush
+        while heaps[0] or heaps[1]:
+            # Expand whichever side has the smaller frontier key
+            if not heaps[1] or (heaps[0] and heaps[0][0][0] <= heaps[1][0][0]):
+                side = 0
+            else:
+                side = 1
+            d, u = pop(heaps[side])
+            if d >= best:
+                # Nothing left on this side can improve the answer
+                heaps[side].clear()
+                continue
+            forward, backward = dist[side], dist[1 - side]
+            if d > forward[u]:
+                continue
+            settled += 1
+            if progress is not None and settled % PROGRESS_INTERVAL == 0:
+                progress(settled)
+            if u in backward and d + backward[u] < best:
+                best, meeting = d + backward[u], u
+            for e in range(offsets[u], offsets[u + 1]):
+                v = targets[e]
+                nd = d + weights[e]
+                if nd < forward.get(v, INF):
+                    forward[v] = nd
+                    previous[side][v] = u
+                    push(heaps[side], (nd, v))
+        self.last_settled = settled
+        if meeting < 0:
+            return [], INF
+
+        upward_path = CSRGraph.unwind(previous[0], source, meeting)
+        downward_path = CSRGraph.unwind(previous[1], target, meeting)
+        path = upward_path + downward_path[-2::-1]
+        return self.unpack(path), best
+
+    def unpack(self, path: List[int]) -> List[int]:
+        """Replace every shortcut hop in path with the original nodes it skips."""
+        result = [path[0]]
+        # Hops are stacked in reverse so popping yields them front to back
+        stack = list(zip(path, path[1:]))[::-1]
+        while stack:
+            a, b = stack.pop()
+            middle = self._middle_of(a, b)
+            if middle < 0:
+                result.append(b)
+            else:
+                stack.append((middle, b))
+                stack.append((a, middle))
+        return result
+
+    def _middle_of(self, a: int, b: int) -> int:
+        # The edge is stored at its lower-ranked endpoint
+        low, high = (a, b) if self._rank[a] < self._rank[b] else (b, a)
+        best_weight, best_middle = INF, -1
+        for e in range(self._offsets[low], self._offsets[low + 1]):
+            if self._targets[e] == high and self._weights[e] < best_weight:
+                best_weight, best_middle = self._weights[e], self._middle[e]
+        return best_middle
+
+    def save(self, path) -> None:
+        with open(path, "wb") as handle:
+            np.savez(handle, version=np.int32(FORMAT_VERSION), rank=self.rank,
+                     up_offsets=self.up_offsets, up_targets=self.up_targets,
+                     up_weights=self.up_weights, up_middle=self.up_middle,
+                     fingerprint=np.array(self.fingerprint))
+
+    @classmethod
+    def load(cls, path, csr: CSRGraph) -> "ContractionHierarchy":
+        """Load a saved hierarchy, refusing one that was built for another graph."""
+        with np.load(path, allow_pickle=False) as data:
+            if int(data["version"]) != FORMAT_VERSION:
+                raise ValueError(f"Unsupported hierarchy format version {int(data['version'])}")
+            fingerprint = str(data["fingerprint"])
+            if fingerprint != graph_fingerprint(csr):
+                raise ValueError("Saved hierarchy does not match the current graph")
+            return cls(data["rank"], data["up_offsets"], data["up_targets"],
+                       data["up_weights"], data["up_middle"], fingerprint)
+
+
+def _witness_distances(remaining, source, excluded, targets, limit) -> Dict[int, float]:
+    """Bounded Dijkstra from source that avoids excluded, stopping early."""
+    dist = {source: 0.0}
+    heap = [(0.0, source)]
+    pending = len(targets)
+    settled = 0
+    while heap and pending and settled < WITNESS_SETTLE_LIMIT:
+        d, u = heapq.heappop(heap)
+        if d > dist[u]:
+            continue
+        if d > limit:
+            break
+        settled += 1
+        if u in targets:
+            pending -= 1
+        for v, (w, _) in remaining[u].items():
+            if v == excluded:
+                continue
+            nd = d + w
+            if nd < dist.get(v, INF):
+                dist[v] = nd
+                heapq.heappush(heap, (nd, v))
+    return dist
@@ -0,0 +1,112 @@
+"""Query-time edge costs from per-edge attributes, departure time and a profile.
+
+An edge's cost is its weight, scaled by how crowded it is in the departure
+hour, then raised or made unusable (inf) for stairs and closures as the
+profile asks. Attributes live in flat per-slot arrays next to the CSR
+graph, so a profile's costs for one hour are a handful of vectorized
+operations, computed once and handed to the searches in place of the
+graph's weights. The graph itself is never copied.
+
+Costs are evaluated at the departure hour for the whole route; a route
+that runs past the hour does not see the next hour's crowding.
+"""
+import math
+from typing import Dict, Hashable, NamedTuple, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from csr_graph import CSRGraph, INF
+
+# Crowding varies by hour of the day
+TIME_BUCKETS = 24
+ATTRIBUTES = ("stairs", "closed", "crowding")
+
+# One crowding factor per hour; a single number applies all day
+Crowding = Union[float, Sequence[float]]
+
+
+class CostProfile(NamedTuple):
+    name: str
+    # Multiplier on stair edges; inf forbids them
+    stairs: float = 1.0
+    crowding: bool = True
+    closures: bool = True
+
+
+PROFILES: Dict[str, CostProfile] = {profile.name: profile for profile in (
+    CostProfile("Standard"),
+    CostProfile("Avoid Stairs", stairs=3.0),
+    CostProfile("Step-free", stairs=INF),
+)}
+
+
+def time_bucket(departure: Optional[float]) -> Optional[int]:
+    """Bucket for a departure given in hours since midnight; None means any time."""
+    if departure is None:
+        return None
+    return int(departure * TIME_BUCKETS // 24) % TIME_BUCKETS
+
+
+def rush_hours(factor: float, hours: Sequence[int]) -> Tuple[float, ...]:
+    """Crowding pattern that is factor during hours and 1.0 otherwise."""
+    return tuple(factor if hour in hours else 1.0 for hour in range(TIME_BUCKETS))
+
+
+def crowding_pattern(crowding: Crowding) -> Tuple[float, ...]:
+    if isinstance(crowding, (int, float)):
+        pattern = (float(crowding),) * TIME_BUCKETS
+    else:
+        pattern = tuple(float(factor) for factor in crowding)
+    if len(pattern) != TIME_BUCKETS:
+        raise ValueError(f"Crowding needs {TIME_BUCKETS} hourly factors, got {len(pattern)}")
+    if not all(math.isfinite(factor) and factor >= 0 for factor in pattern):
+        raise ValueError("Crowding factors must be finite and non-negative")
+    return pattern
+
+
+class EdgeAttributes:
+    """Per-slot attribute arrays aligned with one CSR graph's edges.
+
+    Crowding is stored as an index into a small table of distinct hourly
+    patterns, so a large map with a few kinds of rush hour stays cheap.
+    """
+
+    def __init__(self, stairs: np.ndarray, closed: np.ndarray, pattern: np.ndarray, patterns: np.ndarray):
+        self.stairs = stairs
+        self.closed = closed
+        self.pattern = pattern
+        self.patterns = patterns
+
+    @classmethod
+    def build(cls, csr: CSRGraph, attributes: Dict[Hashable, Dict[Hashable, Dict[str, object]]]) -> "EdgeAttributes":
+        m = len(csr.neighbors)
+        stairs = np.zeros(m, dtype=bool)
+        closed = np.zeros(m, dtype=bool)
+        pattern = np.zeros(m, dtype=np.int32)
+        pattern_ids = {crowding_pattern(1.0): 0}
+        for u, row in attributes.items():
+            for v, values in row.items():
+                # Each direction of an undirected edge has its own slot
+                slots = csr.edge_slots(csr.index[u], csr.index[v])
+                stairs[slots] = values.get("stairs", False)
+                closed[slots] = values.get("closed", False)
+                if "crowding" in values:
+                    key = crowding_pattern(values["crowding"])
+                    pattern[slots] = pattern_ids.setdefault(key, len(pattern_ids))
+        patterns = np.array(list(pattern_ids), dtype=np.float64)
+        return cls(stairs, closed, pattern, patterns)
+
+
+def edge_costs(weights: np.ndarray, attributes: EdgeAttributes, profile: CostProfile,
+               bucket: Optional[int]) -> np.ndarray:
+    """Per-slot costs; weights itself, uncopied, when nothing changes them."""
+    costs = weights
+    if profile.crowding and bucket is not None and (attributes.patterns[:, bucket] != 1.0).any():
+        costs = costs * attributes.patterns[:, bucket][attributes.pattern]
+    if profile.stairs != 1.0 and attributes.stairs.any():
+        # inf * 0 would give nan for a zero-weight stair edge
+        stair_costs = INF if math.isinf(profile.stairs) else costs * profile.stairs
+        costs = np.where(attributes.stairs, stair_costs, costs)
+    if profile.closures and attributes.closed.any():
+        costs = np.where(attributes.closed, INF, costs)
+    return costs
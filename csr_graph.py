@@ -0,0 +1,364 @@
+"""Frozen compressed-sparse-row graph used on the routing query path.
+
+Node names are interned to dense integer ids; adjacency lives in three flat
+NumPy arrays (offsets, neighbours, weights) so a campus-scale map costs a few
+bytes per edge instead of a dict per node.
+"""
+import heapq
+import math
+from typing import Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+INF = float("inf")
+# Searches report to their progress callback once per this many settled nodes
+PROGRESS_INTERVAL = 1024
+
+# progress(settled) may raise to abandon a search, e.g. when it was cancelled
+Progress = Optional[Callable[[int], None]]
+
+
+class EdgeCosts:
+    """Per-slot weights that replace a graph's own for some queries.
+
+    Built once per cost profile, so switching profiles never touches the
+    graph; inf marks an edge that may not be used.
+    """
+
+    def __init__(self, csr: "CSRGraph", weights: np.ndarray):
+        self.weights = weights
+        self.view = memoryview(weights)
+        self.heuristic_scale = csr._compute_heuristic_scale(weights)
+
+
+class CSRGraph:
+    def __init__(self, names: Sequence[Hashable], offsets: np.ndarray,
+                 neighbors: np.ndarray, weights: np.ndarray,
+                 coords: Optional[np.ndarray] = None):
+        self.names = list(names)
+        self.index: Dict[Hashable, int] = {name: i for i, name in enumerate(self.names)}
+        self.offsets = offsets
+        self.neighbors = neighbors
+        self.weights = weights
+        # Optional (n, 2) array of node coordinates, NaN where unknown
+        self.coords = coords
+
+        # memoryviews index as plain Python scalars, which keeps the inner
+        # search loop free of NumPy scalar boxing
+        self._offsets = memoryview(offsets)
+        self._neighbors = memoryview(neighbors)
+        self._weights = memoryview(weights)
+        self._heuristic_scale: Optional[float] = None
+        self._xs = self._ys = None
+        # Nodes settled by the most recent search, for comparing strategies
+        self.last_settled = 0
+
+    @classmethod
+    def from_adjacency(cls, adjacency: Dict[Hashable, Dict[Hashable, float]],
+                       positions: Optional[Dict[Hashable, Tuple[float, float]]] = None) -> "CSRGraph":
+        names = list(adjacency)
+        index = {name: i for i, name in enumerate(names)}
+        degrees = np.fromiter((len(adjacency[name]) for name in names), dtype=np.int64, count=len(names))
+        offsets = np.zeros(len(names) + 1, dtype=np.int64)
+        np.cumsum(degrees, out=offsets[1:])
+        neighbors = np.fromiter((index[v] for name in names for v in adjacency[name]),
+                                dtype=np.int32, count=offsets[-1])
+        weights = np.fromiter((w for name in names for w in adjacency[name].values()),
+                              dtype=np.float64, count=offsets[-1])
+
+        coords = None
+        if positions:
+            coords = np.full((len(names), 2), np.nan)
+            for name, (x, y) in positions.items():
+                i = index.get(name)
+                if i is not None:
+                    coords[i] = (x, y)
+        return cls(names, offsets, neighbors, weights, coords)
+
+    @classmethod
+    def from_edges(cls, names: Sequence[Hashable], sources: np.ndarray, targets: np.ndarray,
+                   weights: np.ndarray, coords: Optional[np.ndarray] = None) -> "CSRGraph":
+        """Build from parallel arrays listing each undirected edge once.
+
+        Fully vectorized, so million-node generated maps never go through
+        per-node dicts.
+        """
+        n = len(names)
+        heads = np.concatenate([sources, targets])
+        tails = np.concatenate([targets, sources])
+        order = np.argsort(heads, kind="stable")
+        offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(heads, minlength=n), out=offsets[1:])
+        return cls(names, offsets, tails[order].astype(np.int32),
+                   np.concatenate([weights, weights])[order].astype(np.float64), coords)
+
+    @property
+    def node_count(self) -> int:
+        return len(self.names)
+
+    @property
+    def edge_count(self) -> int:
+        # Each undirected edge is stored once per direction
+        return len(self.neighbors) // 2
+
+    def nbytes(self) -> int:
+        return self.offsets.nbytes + self.neighbors.nbytes + self.weights.nbytes
+
+    def degree(self, u: int) -> int:
+        return self._offsets[u + 1] - self._offsets[u]
+
+    def edge_weight(self, u: int, v: int, costs: Optional[EdgeCosts] = None) -> float:
+        weights = self._weights if costs is None else costs.view
+        lo, hi = self._offsets[u], self._offsets[u + 1]
+        best = INF
+        for e in range(lo, hi):
+            if self._neighbors[e] == v and weights[e] < best:
+                best = weights[e]
+        return best
+
+    def shortest_path(self, source: int, target: int, progress: Progress = None,
+                      costs: Optional[EdgeCosts] = None) -> Tuple[List[int], float]:
+        """Heap-based Dijkstra returning (path, cost) in a single pass.
+
+        Returns ([], inf) when target is unreachable. Every search takes
+        optional costs to use in place of the graph's own weights.
+        """
+        if source == target:
+            return [source], 0.0
+        offsets, neighbors = self._offsets, self._neighbors
+        weights = self._weights if costs is None else costs.view
+        dist = [INF] * len(self.names)
+        dist[source] = 0.0
+        previous = {}
+        heap = [(0.0, source)]
+        pop, push = heapq.heappop, heapq.heappush
+        settled = 0
+        while heap:
+            d, u = pop(heap)
+            if d > dist[u]:
+                continue
+            settled += 1
+            if progress is not None and settled % PROGRESS_INTERVAL == 0:
+                progress(settled)
+            if u == target:
+                self.last_settled = settled
+                return self.unwind(previous, source, target), d
+            for e in range(offsets[u], offsets[u + 1]):
+                v = neighbors[e]
+                nd = d + weights[e]
+                if nd < dist[v]:
+                    dist[v] = nd
+                    previous[v] = u
+                    push(heap, (nd, v))
+        self.last_settled = settled
+        return [], INF
+
+    def nearest_of(self, source: int, targets, progress: Progress = None,
+                   costs: Optional[EdgeCosts] = None) -> Tuple[List[int], float]:
+        """Dijkstra that stops at the first of targets it settles, i.e. the closest.
+
+        Same contract as shortest_path; the path ends at the chosen target.
+        """
+        targets = set(targets)
+        offsets, neighbors = self._offsets, self._neighbors
+        weights = self._weights if costs is None else costs.view
+        dist = [INF] * len(self.names)
+        dist[source] = 0.0
+        previous = {}
+        heap = [(0.0, source)]
+        pop, push = heapq.heappop, heapq.heappush
+        settled = 0
+        while heap:
+            d, u = pop(heap)
+            if d > dist[u]:
+                continue
+            settled += 1
+            if progress is not None and settled % PROGRESS_INTERVAL == 0:
+                progress(settled)
+            if u in targets:
+                self.last_settled = settled
+                return self.unwind(previous, source, u), d
+            for e in range(offsets[u], offsets[u + 1]):
+                v = neighbors[e]
+                nd = d + weights[e]
+                if nd < dist[v]:
+                    dist[v] = nd
+                    previous[v] = u
+                    push(heap, (nd, v))
+        self.last_settled = settled
+        return [], INF
+
+    def single_source(self, source, targets=None, progress: Progress = None,
+                      costs: Optional[EdgeCosts] = None) -> Tuple[List[float], Dict[int, int]]:
+        """Dijkstra from source returning (dist, previous) for every reached node.
+
+        source may also be a dict of node -> starting distance, to search
+        from several seeds at once. When targets is given, the search stops
+        as soon as all of them are settled; dist entries beyond that point
+        are upper bounds only.
+        """
+        offsets, neighbors = self._offsets, self._neighbors
+        weights = self._weights if costs is None else costs.view
+        dist = [INF] * len(self.names)
+        seeds = source if isinstance(source, dict) else {source: 0.0}
+        for seed, start in seeds.items():
+            dist[seed] = min(dist[seed], start)
+        previous: Dict[int, int] = {}
+        pending = set(targets) if targets is not None else None
+        heap = [(start, seed) for seed, start in seeds.items()]
+        heapq.heapify(heap)
+        pop, push = heapq.heappop, heapq.heappush
+        settled = 0
+        while heap:
+            d, u = pop(heap)
+            if d > dist[u]:
+                continue
+            settled += 1
+            if progress is not None and settled % PROGRESS_INTERVAL == 0:
+                progress(settled)
+            if pending is not None:
+                pending.discard(u)
+                if not pending:
+                    break
+            for e in range(offsets[u], offsets[u + 1]):
+                v = neighbors[e]
+                nd = d + weights[e]
+                if nd < dist[v]:
+                    dist[v] = nd
+                    previous[v] = u
+                    push(heap, (nd, v))
+        self.last_settled = settled
+        return dist, previous
+
+    def heuristic_scale(self) -> float:
+        """Largest factor k for which k * euclidean distance never overestimates.
+
+        Taking the minimum weight/length ratio over all edges makes the
+        heuristic consistent, not just admissible. Returns 0.0 when the map
+        cannot support A* (missing coordinates, or a zero-weight edge between
+        distinct positions), in which case callers should use Dijkstra.
+        """
+        if self._heuristic_scale is None:
+            self._heuristic_scale = self._compute_heuristic_scale()
+        return self._heuristic_scale
+
+    def _compute_heuristic_scale(self, weights: Optional[np.ndarray] = None) -> float:
+        if self.coords is None or len(self.neighbors) == 0 or not np.isfinite(self.coords).all():
+            return 0.0
+        weights = self.weights if weights is None else weights
+        sources = np.repeat(np.arange(self.node_count), np.diff(self.offsets))
+        lengths = np.hypot(*(self.coords[sources] - self.coords[self.neighbors]).T)
+        # Unusable (infinite cost) edges never constrain the heuristic
+        spanning = (lengths > 0) & np.isfinite(weights)
+        if not spanning.any():
+            return 0.0
+        scale = float(np.min(weights[spanning] / lengths[spanning]))
+        if not math.isfinite(scale) or scale <= 0.0:
+            return 0.0
+        # Guard against rounding pushing h(u) a hair above the true distance
+        return scale * (1.0 - 1e-9)
+
+    def astar_path(self, source: int, target: int, progress: Progress = None,
+                   costs: Optional[EdgeCosts] = None) -> Tuple[List[int], float]:
+        """A* with a scaled euclidean heuristic; same contract as shortest_path."""
+        scale = self.heuristic_scale() if costs is None else costs.heuristic_scale
+        if scale <= 0.0:
+            return self.shortest_path(source, target, progress, costs)
+        if source == target:
+            return [source], 0.0
+        offsets, neighbors = self._offsets, self._neighbors
+        weights = self._weights if costs is None else costs.view
+        xs, ys = self._coordinate_views()
+        tx, ty = xs[target], ys[target]
+        hypot = math.hypot
+
+        dist = [INF] * len(self.names)
+        dist[source] = 0.0
+        previous = {}
+        heap = [(scale * hypot(xs[source] - tx, ys[source] - ty), 0.0, source)]
+        pop, push = heapq.heappop, heapq.heappush
+        settled = 0
+        while heap:
+            _, d, u = pop(heap)
+            if d > dist[u]:
+                continue
+            settled += 1
+            if progress is not None and settled % PROGRESS_INTERVAL == 0:
+                progress(settled)
+            if u == target:
+                self.last_settled = settled
+                return self.unwind(previous, source, target), d
+            for e in range(offsets[u], offsets[u + 1]):
+                v = neighbors[e]
+                nd = d + weights[e]
+                if nd < dist[v]:
+                    dist[v] = nd
+                    previous[v] = u
+                    push(heap, (nd + scale * hypot(xs[v] - tx, ys[v] - ty), nd, v))
+        self.last_settled = settled
+        return [], INF
+
+    def guided_path(self, source: int, target: int, heuristic: Sequence[float],
+                    banned_nodes=frozenset(), banned_slots=frozenset(),
+                    penalties: Optional[Dict[int, float]] = None,
+                    progress: Progress = None, costs: Optional[EdgeCosts] = None) -> Tuple[List[int], float]:
+        """A* under a precomputed per-node heuristic, on a restricted graph.
+
+        heuristic[v] must not overestimate the distance from v to target;
+        exact distances from a search rooted at target are ideal and stay
+        valid under the restrictions. Banned nodes and edge slots (indices
+        into neighbors) are skipped, and penalties multiplies the weight of
+        given slots. Returns (path, cost under penalties) or ([], inf).
+        """
+        offsets, neighbors = self._offsets, self._neighbors
+        weights = self._weights if costs is None else costs.view
+        if heuristic[source] == INF:
+            return [], INF
+        dist = {source: 0.0}
+        previous = {}
+        heap = [(heuristic[source], 0.0, source)]
+        pop, push = heapq.heappop, heapq.heappush
+        settled = 0
+        while heap:
+            _, d, u = pop(heap)
+            if d > dist[u]:
+                continue
+            settled += 1
+            if progress is not None and settled % PROGRESS_INTERVAL == 0:
+                progress(settled)
+            if u == target:
+                self.last_settled = settled
+                return self.unwind(previous, source, target), d
+            for e in range(offsets[u], offsets[u + 1]):
+                v = neighbors[e]
+                if v in banned_nodes or e in banned_slots or heuristic[v] == INF:
+                    continue
+                nd = d + (weights[e] * penalties.get(e, 1.0) if penalties else weights[e])
+                if nd < dist.get(v, INF):
+                    dist[v] = nd
+                    previous[v] = u
+                    push(heap, (nd + heuristic[v], nd, v))
+        self.last_settled = settled
+        return [], INF
+
+    def edge_slots(self, u: int, v: int) -> List[int]:
+        """Indices into neighbors/weights of every u -> v edge."""
+        return [e for e in range(self._offsets[u], self._offsets[u + 1]) if self._neighbors[e] == v]
+
+    def path_cost(self, path: Sequence[int], costs: Optional[EdgeCosts] = None) -> float:
+        return sum(self.edge_weight(u, v, costs) for u, v in zip(path, path[1:]))
+
+    def _coordinate_views(self):
+        if self._xs is None:
+            self._xs = memoryview(np.ascontiguousarray(self.coords[:, 0]))
+            self._ys = memoryview(np.ascontiguousarray(self.coords[:, 1]))
+        return self._xs, self._ys
+
+    @staticmethod
+    def unwind(previous: Dict[int, int], source: Optional[int], target: int) -> List[int]:
+        """Path to target; with source None, from whichever seed it was reached from."""
+        path = [target]
+        while path[-1] != source and path[-1] in previous:
+            path.append(previous[path[-1]])
+        path.reverse()
+        return path
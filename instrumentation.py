@@ -0,0 +1,235 @@
+"""Stage timing, counters and optional profiling for route queries.
+
+Disabled unless the PATHFINDER_METRICS environment variable is set, to a
+comma-separated list of:
+
+    on        span timings and counters
+    profile   also run cProfile inside capture() blocks
+    memory    also record tracemalloc peaks inside capture() blocks
+
+When disabled, span() hands back one shared no-op context manager, so an
+instrumented call site costs an attribute check and nothing else.
+
+If PATHFINDER_METRICS_FILE is set, metrics are written there at exit as
+Prometheus text for a .prom file, JSON otherwise. Profiles go alongside as
+<file>.<capture>.prof, readable with pstats or snakeviz.
+"""
+import atexit
+import bisect
+import cProfile
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict, List
+
+ENV_VAR = "PATHFINDER_METRICS"
+FILE_ENV_VAR = "PATHFINDER_METRICS_FILE"
+PREFIX = "pathfinder"
+
+# Upper bounds of the latency histogram buckets, in seconds
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+           0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    def __init__(self):
+        # One extra bucket catches everything above the last bound
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Bucket upper bound at or above the q-th observation."""
+        rank, seen = q * self.count, 0
+        for bound, count in zip(BUCKETS + (float("inf"),), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("metrics", "name", "started")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.name, time.perf_counter() - self.started)
+        return False
+
+
+class Metrics:
+    def __init__(self, enabled: bool = False, profile: bool = False, memory: bool = False):
+        self.enabled = enabled or profile or memory
+        self.profile = profile
+        self.memory = memory
+        self.histograms: Dict[str, Histogram] = {}
+        self.counters: Dict[str, int] = {}
+        self.memory_peaks: Dict[str, int] = {}
+        self.profiles: Dict[str, cProfile.Profile] = {}
+        # Route searches run on a worker thread while the UI thread records too
+        self._lock = threading.Lock()
+        self._profiling = False
+        # Highest traced memory seen by each running memory capture; the
+        # tracemalloc peak is global, so it is folded into these before any reset
+        self._tracing: List[List[int]] = []
+
+    @classmethod
+    def from_environment(cls) -> "Metrics":
+        modes = {mode.strip().lower() for mode in os.environ.get(ENV_VAR, "").split(",")}
+        modes.discard("")
+        modes.discard("0")
+        modes.discard("off")
+        return cls(enabled=bool(modes), profile="profile" in modes, memory="memory" in modes)
+
+    def span(self, name: str):
+        """Context manager timing one stage into the histogram for name."""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name)
+
+    def observe(self, name: str, seconds: float) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    def count(self, name: str, amount: int = 1) -> None:
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def capture(self, name: str):
+        """A span that, in profile/memory mode, also profiles its body.
+
+        Only one capture profiles at a time; nested or concurrent ones are
+        still timed. Memory peaks are kept for every capture, nested or not.
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return self._capture(name)
+
+    @contextmanager
+    def _capture(self, name: str):
+        profiler = None
+        if self.profile:
+            with self._lock:
+                if not self._profiling:
+                    self._profiling = True
+                    profiler = self.profiles.setdefault(name, cProfile.Profile())
+        tracing = self.memory and tracemalloc.is_tracing()
+        if self.memory and not tracing:
+            tracemalloc.start()
+            tracing = True
+        if tracing:
+            with self._lock:
+                # Nested or concurrent captures keep the peak they had so far
+                self._fold_peak()
+                tracemalloc.reset_peak()
+                baseline = tracemalloc.get_traced_memory()[0]
+                highest = [baseline]
+                self._tracing.append(highest)
+        if profiler is not None:
+            profiler.enable()
+        try:
+            with self.span(name):
+                yield
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                self._profiling = False
+            if tracing:
+                with self._lock:
+                    self._fold_peak()
+                    self._tracing = [other for other in self._tracing if other is not highest]
+                    peak = highest[0] - baseline
+                    self.memory_peaks[name] = max(self.memory_peaks.get(name, 0), peak)
+
+    def _fold_peak(self) -> None:
+        peak = tracemalloc.get_traced_memory()[1]
+        for highest in self._tracing:
+            highest[0] = max(highest[0], peak)
+
+    def reset(self) -> None:
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+            self.memory_peaks.clear()
+            self.profiles.clear()
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "stages": {name: {"count": h.count, "sum_seconds": h.sum,
+                                  "p50_seconds": h.quantile(0.5), "p99_seconds": h.quantile(0.99),
+                                  "buckets": dict(zip([str(b) for b in BUCKETS] + ["+Inf"], h.counts))}
+                           for name, h in self.histograms.items()},
+                "counters": dict(self.counters),
+                "memory_peak_bytes": dict(self.memory_peaks),
+            }
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot(), indent=2)
+
+    def to_prometheus(self) -> str:
+        lines: List[str] = []
+        with self._lock:
+            if self.histograms:
+                lines += [f"# HELP {PREFIX}_stage_seconds Time spent per route stage.",
+                          f"# TYPE {PREFIX}_stage_seconds histogram"]
+            for name, histogram in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, count in zip([f"{b:g}" for b in BUCKETS] + ["+Inf"], histogram.counts):
+                    cumulative += count
+                    lines.append(f'{PREFIX}_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+                lines.append(f'{PREFIX}_stage_seconds_sum{{stage="{name}"}} {histogram.sum!r}')
+                lines.append(f'{PREFIX}_stage_seconds_count{{stage="{name}"}} {histogram.count}')
+            for name, value in sorted(self.counters.items()):
+                lines += [f"# TYPE {PREFIX}_{name}_total counter", f"{PREFIX}_{name}_total {value}"]
+            if self.memory_peaks:
+                lines.append(f"# TYPE {PREFIX}_memory_peak_bytes gauge")
+            for name, value in sorted(self.memory_peaks.items()):
+                lines.append(f'{PREFIX}_memory_peak_bytes{{stage="{name}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str) -> None:
+        """Write metrics (Prometheus text for .prom, else JSON) and any profiles."""
+        with open(path, "w", encoding="utf-8") as handle:
+            handle.write(self.to_prometheus() if path.endswith(".prom") else self.to_json())
+        for name, profiler in self.profiles.items():
+            profiler.dump_stats(f"{path}.{name}.prof")
+
+
+metrics = Metrics.from_environment()
+
+if metrics.enabled and os.environ.get(FILE_ENV_VAR):
+    atexit.register(metrics.write, os.environ[FILE_ENV_VAR])
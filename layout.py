@@ -0,0 +1,294 @@
+"""Force-directed layout that treats edge weights as target distances.
+
+A full layout starts from pivot MDS (Brandes and Pich): route distances
+from a few far-apart pivot nodes are reduced to two dimensions, which gets
+the overall shape right in a handful of Dijkstra searches. A force-directed
+pass then settles the local detail. Each edge is a spring whose rest length
+is its weight, and nodes closer than REPULSION_RADIUS spacings push each
+other apart so buildings do not overlap. The close pairs come from a
+uniform grid with cells one radius wide, and every force of an iteration is
+computed with NumPy over whole arrays, so an iteration is a few vectorized
+passes even for 10k+ nodes. Moves are capped by a temperature that cools to
+zero over the run.
+
+Because edge lengths end up close to their weights, euclidean distance is
+a usable lower bound on route cost again, which the A* heuristic needs.
+
+place() adds nodes to an existing layout: the new nodes start at the
+centre of their positioned neighbours, or in the map's free space when
+they have none, and only they move, against the fixed nodes around them.
+"""
+import math
+from typing import Dict, Hashable, Iterable, Optional, Sequence, Tuple
+
+import numpy as np
+
+from csr_graph import CSRGraph
+
+Node = Hashable
+Position = Tuple[float, float]
+Edge = Tuple[Node, Node, float]
+
+ITERATIONS = 60
+PLACE_ITERATIONS = 40
+# Fixed nodes within this many repulsion radii of a new node's start can push it
+PLACE_REACH = 4
+# Dijkstra searches per connected component for the initial layout
+PIVOTS = 24
+# Nodes closer than this many spacings repel each other
+REPULSION_RADIUS = 1.0
+# First-iteration move limit, in spacings
+START_TEMPERATURE = 2.0
+# Half of the 3x3 block of grid cells around a cell; the other half is
+# covered when the neighbouring cell takes its turn
+_HALF_NEIGHBOURHOOD = ((0, 0), (1, -1), (1, 0), (1, 1), (0, 1))
+
+
+def spacing(weights) -> float:
+    """Typical distance between neighbouring nodes: the median positive edge weight."""
+    weights = np.asarray(weights, dtype=float)
+    weights = weights[np.isfinite(weights) & (weights > 0)]
+    return float(np.median(weights)) if len(weights) else 1.0
+
+
+def force_layout(nodes: Iterable[Node], edges: Iterable[Edge],
+                 positions: Optional[Dict[Node, Position]] = None, fixed: Iterable[Node] = (),
+                 iterations: int = ITERATIONS, seed: Optional[int] = 0) -> Dict[Node, Position]:
+    """Coordinates for nodes, with each edge's length drawn towards its weight.
+
+    positions gives starting points for any of the nodes; the rest start
+    beside their positioned neighbours or at random. With no positions at
+    all the start is computed from route distances instead. Nodes in fixed
+    keep their starting point.
+    """
+    nodes = list(nodes)
+    index = {node: i for i, node in enumerate(nodes)}
+    edges = [(index[u], index[v], w) for u, v, w in edges if u in index and v in index and u != v]
+    sources, targets, lengths = _edge_arrays(edges)
+    k = spacing(lengths)
+    rng = np.random.default_rng(seed)
+
+    pos = np.full((len(nodes), 2), np.nan)
+    for node, position in (positions or {}).items():
+        if node in index:
+            pos[index[node]] = position
+    if len(nodes) and np.isnan(pos[:, 0]).all():
+        pos[:] = _pivot_mds(len(nodes), sources, targets, lengths, k)
+    else:
+        _initial_positions(pos, sources, targets, k, rng)
+    movable = np.ones(len(nodes), dtype=bool)
+    movable[[index[node] for node in fixed if node in index]] = False
+    _relax(pos, movable, sources, targets, lengths, k, iterations, rng)
+    return {node: (x, y) for node, (x, y) in zip(nodes, pos.tolist())}
+
+
+def place(positions: Dict[Node, Position], new_nodes: Sequence[Node], edges: Iterable[Edge],
+          iterations: int = PLACE_ITERATIONS, seed: Optional[int] = 0) -> Dict[Node, Position]:
+    """Coordinates for new_nodes, leaving every node already in positions where it is.
+
+    edges may be the whole map's; only those touching new_nodes are used
+    as springs, but all of them set the spacing. A node in new_nodes that
+    already has a position is placed again.
+    """
+    moving = list(dict.fromkeys(new_nodes))
+    if not moving:
+        return {}
+    moving_set = set(moving)
+    edges = list(edges)
+    k = spacing([w for _, _, w in edges])
+    local = [(u, v, w) for u, v, w in edges if (u in moving_set or v in moving_set) and u != v]
+    others = [node for node in positions if node not in moving_set]
+    other_pos = np.array([positions[node] for node in others], dtype=float).reshape(-1, 2)
+    anchors = list({node for u, v, _ in local for node in (u, v)
+                    if node not in moving_set and node in positions})
+
+    # Start beside positioned neighbours; unconnected nodes start beside
+    # any existing node and repulsion moves them into a gap
+    nodes = moving + anchors
+    index = {node: i for i, node in enumerate(nodes)}
+    sources, targets, lengths = _edge_arrays([(index[u], index[v], w) for u, v, w in local
+                                              if u in index and v in index])
+    pos = np.full((len(nodes), 2), np.nan)
+    for i, node in enumerate(anchors, len(moving)):
+        pos[i] = positions[node]
+    rng = np.random.default_rng(seed)
+    _initial_positions(pos, sources, targets, k, rng, other_pos)
+
+    # Only the fixed nodes near the new ones take part in the relaxation
+    start = pos[:len(moving)]
+    reach = PLACE_REACH * REPULSION_RADIUS * k
+    low, high = start.min(axis=0) - reach, start.max(axis=0) + reach
+    near = np.flatnonzero(((other_pos >= low) & (other_pos <= high)).all(axis=1))
+    nodes = moving + [others[i] for i in near]
+    index = {node: i for i, node in enumerate(nodes)}
+    sources, targets, lengths = _edge_arrays([(index[u], index[v], w) for u, v, w in local
+                                              if u in index and v in index])
+    pos = np.vstack([start, other_pos[near]])
+    movable = np.zeros(len(nodes), dtype=bool)
+    movable[:len(moving)] = True
+    _relax(pos, movable, sources, targets, lengths, k, iterations, rng)
+    return {node: (x, y) for node, (x, y) in zip(moving, pos[:len(moving)].tolist())}
+
+
+def _edge_arrays(edges):
+    if not edges:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp), np.empty(0)
+    sources, targets, lengths = (np.array(column) for column in zip(*edges))
+    lengths = lengths.astype(float)
+    # An impassable (inf) edge has no length to draw, so it is no spring
+    usable = np.isfinite(lengths)
+    return (sources[usable].astype(np.intp), targets[usable].astype(np.intp),
+            np.maximum(lengths[usable], 0.0))
+
+
+def _pivot_mds(n: int, sources, targets, lengths, k: float) -> np.ndarray:
+    # Lay out each connected component on its own, then pack them side by side
+    csr = CSRGraph.from_edges(list(range(n)), sources, targets, lengths)
+    placed = np.zeros(n, dtype=bool)
+    components = []
+    for seed in range(n):
+        if placed[seed]:
+            continue
+        dist = np.array(csr.single_source(seed)[0])
+        members = np.flatnonzero(np.isfinite(dist))
+        placed[members] = True
+        components.append((members, _component_mds(csr, members, dist[members], k)))
+    return _pack(n, components, k)
+
+
+def _component_mds(csr: CSRGraph, members: np.ndarray, first: np.ndarray, k: float) -> np.ndarray:
+    if len(members) < 3:
+        # A single node, or two along the edge between them
+        return np.column_stack([first, np.zeros(len(members))])
+    # Each pivot is the member farthest from those chosen so far
+    columns, nearest = [first], first.copy()
+    while len(columns) < min(PIVOTS, len(members)) and nearest.max() > 0:
+        pivot = members[int(np.argmax(nearest))]
+        columns.append(np.array(csr.single_source(pivot)[0])[members])
+        nearest = np.minimum(nearest, columns[-1])
+    if len(columns) < 2:
+        # Every route inside is free (zero weights), so distances give no
+        # shape; start from a square grid one spacing apart instead
+        side = math.ceil(math.sqrt(len(members)))
+        return np.column_stack([np.arange(len(members)) % side, np.arange(len(members)) // side]) * k
+    dist = np.column_stack(columns)
+    squared = dist ** 2
+    centred = -0.5 * (squared - squared.mean(axis=0) - squared.mean(axis=1)[:, None] + squared.mean())
+    _, vectors = np.linalg.eigh(centred.T @ centred)
+    coords = centred @ vectors[:, :-3:-1]
+
+    # The projection's scale is arbitrary; fit it to the distances to the pivots
+    pivots = np.argmin(dist, axis=0)
+    drawn = np.hypot(*(coords[:, None, :] - coords[pivots][None, :, :]).transpose(2, 0, 1))
+    fit = (drawn * dist).sum() / max((drawn * drawn).sum(), 1e-12)
+    return coords * fit
+
+
+def _pack(n: int, components, k: float) -> np.ndarray:
+    # Rows of components, largest first, in a roughly square block
+    pos = np.empty((n, 2))
+    sizes = [np.ptp(coords, axis=0) for _, coords in components]
+    width = max(math.sqrt(sum((w + k) * (h + k) for w, h in sizes)), max(w for w, _ in sizes))
+    x = y = row = 0.0
+    for c in sorted(range(len(components)), key=lambda c: -len(components[c][0])):
+        members, coords = components[c]
+        w, h = sizes[c]
+        if x > 0 and x + w > width:
+            x, y, row = 0.0, y + row + k, 0.0
+        pos[members] = coords - coords.min(axis=0) + (x, y)
+        x, row = x + w + k, max(row, h)
+    return pos
+
+
+def _initial_positions(pos: np.ndarray, sources, targets, k: float, rng, beside=None) -> None:
+    # Spread outwards from positioned nodes: each pass places the nodes with
+    # a positioned neighbour at their neighbours' centre, slightly jittered
+    missing = np.isnan(pos[:, 0])
+    ends = np.concatenate([sources, targets])
+    others = np.concatenate([targets, sources])
+    while missing.any() and not missing.all():
+        usable = missing[ends] & ~missing[others]
+        if not usable.any():
+            break
+        counts = np.bincount(ends[usable], minlength=len(pos))
+        sums = np.column_stack([np.bincount(ends[usable], weights=pos[others[usable], axis], minlength=len(pos))
+                                for axis in (0, 1)])
+        placed = counts > 0
+        pos[placed] = sums[placed] / counts[placed, None] + rng.normal(0.0, k / 2, (placed.sum(), 2))
+        missing &= ~placed
+    if missing.any():
+        # Nothing to anchor to: next to random nodes of beside, or scattered
+        # over a square sized for the node count
+        if beside is not None and len(beside):
+            picks = beside[rng.integers(len(beside), size=missing.sum())]
+            pos[missing] = picks + rng.normal(0.0, k, (missing.sum(), 2))
+        else:
+            pos[missing] = rng.uniform(0.0, k * math.sqrt(len(pos)), (missing.sum(), 2))
+
+
+def _relax(pos: np.ndarray, movable: np.ndarray, sources, targets, lengths, k: float,
+           iterations: int, rng) -> None:
+    if not movable.any():
+        return
+    n = len(pos)
+    radius = REPULSION_RADIUS * k
+    for step in range(iterations):
+        force = np.zeros((n, 2))
+
+        # Springs: pull or push each edge towards its weight
+        delta = pos[targets] - pos[sources]
+        dist = np.maximum(np.hypot(delta[:, 0], delta[:, 1]), 1e-9 * k)
+        pull = delta * ((dist - lengths) / dist)[:, None]
+        for axis in (0, 1):
+            force[:, axis] += (np.bincount(sources, weights=pull[:, axis], minlength=n)
+                               - np.bincount(targets, weights=pull[:, axis], minlength=n))
+
+        # Repulsion between nearby pairs, k^2 / d as in Fruchterman-Reingold,
+        # less its value at the cutoff so it fades out smoothly
+        first, second = _close_pairs(pos, radius)
+        delta = pos[first] - pos[second]
+        dist = np.hypot(delta[:, 0], delta[:, 1])
+        stacked = dist < 1e-9 * k
+        if stacked.any():
+            # Coincident nodes get a random direction to separate along
+            delta[stacked] = rng.normal(0.0, k * 1e-3, (stacked.sum(), 2))
+            dist[stacked] = np.hypot(delta[stacked, 0], delta[stacked, 1])
+        push = np.where(dist < radius, k * k / dist ** 2 - k * k / (radius * dist), 0.0)
+        push = delta * push[:, None]
+        for axis in (0, 1):
+            force[:, axis] += (np.bincount(first, weights=push[:, axis], minlength=n)
+                               - np.bincount(second, weights=push[:, axis], minlength=n))
+
+        # Move, capped by the cooling temperature
+        temperature = START_TEMPERATURE * k * (1.0 - step / iterations)
+        size = np.maximum(np.hypot(force[:, 0], force[:, 1]), 1e-12)
+        force *= np.minimum(1.0, temperature / size)[:, None]
+        force[~movable] = 0.0
+        pos += force
+
+
+def _close_pairs(pos: np.ndarray, radius: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Index pairs (i, j) that share or neighbour a grid cell one radius wide; a superset
+    of the pairs within radius."""
+    cells = np.floor((pos - pos.min(axis=0)) / radius).astype(np.int64)
+    columns = int(cells[:, 1].max()) + 3
+    keys = (cells[:, 0] + 1) * columns + (cells[:, 1] + 1)
+    order = np.argsort(keys, kind="stable")
+    unique, starts, counts = np.unique(keys[order], return_index=True, return_counts=True)
+
+    firsts, seconds = [], []
+    for dx, dy in _HALF_NEIGHBOURHOOD:
+        wanted = keys + dx * columns + dy
+        slot = np.minimum(np.searchsorted(unique, wanted), len(unique) - 1)
+        hit = unique[slot] == wanted
+        members = counts[slot[hit]]
+        # Every node paired with every member of the wanted cell
+        first = np.repeat(np.flatnonzero(hit), members)
+        offsets = np.arange(members.sum()) - np.repeat(np.cumsum(members) - members, members)
+        second = order[np.repeat(starts[slot[hit]], members) + offsets]
+        if (dx, dy) == (0, 0):
+            keep = first < second
+            first, second = first[keep], second[keep]
+        firsts.append(first)
+        seconds.append(second)
+    return np.concatenate(firsts), np.concatenate(seconds)
@@ -0,0 +1,102 @@
+"""Show the window first; load matplotlib and build the map afterwards.
+
+Importing matplotlib with its Tk backend and building the map figure take
+seconds on a kiosk, and the navigators used to do both before their window
+appeared. Now they lay out their controls and call start(): once the
+window has been painted, the plotting modules are imported on a background
+thread, and the map is then built on the Tk thread. The controls work
+meanwhile.
+
+Each stage is recorded in seconds since the process started, as a
+startup_<stage> metric, and printed to stderr when PATHFINDER_METRICS is set:
+
+    imports       the app's own imports done
+    first_paint   window drawn and accepting input
+    plotting      matplotlib and its Tk backend imported
+    map_ready     map figure built and drawn
+"""
+import importlib
+import os
+import sys
+import threading
+import time
+import tkinter as tk
+from typing import Callable, Dict
+
+from instrumentation import metrics
+
+POLL_MS = 20
+# Imported off the Tk thread; map_renderer pulls in matplotlib and its Tk backend
+PLOTTING_MODULES = ("map_renderer",)
+
+
+def _process_age() -> float:
+    # Seconds since the interpreter was started, where /proc can tell
+    try:
+        with open("/proc/self/stat") as handle:
+            started = int(handle.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as handle:
+            uptime = float(handle.read().split()[0])
+        return max(uptime - started / os.sysconf("SC_CLK_TCK"), 0.0)
+    except (OSError, ValueError, IndexError):
+        return 0.0
+
+
+STARTED = time.perf_counter() - _process_age()
+stages: Dict[str, float] = {}
+
+
+def mark(stage: str) -> None:
+    stages[stage] = time.perf_counter() - STARTED
+    metrics.observe(f"startup_{stage}", stages[stage])
+
+
+def start(master: tk.Tk, frame: tk.Widget, build_map: Callable[[], None]) -> None:
+    """Build the map into frame once the window is up, showing a placeholder until then.
+
+    build_map runs on the Tk thread after PLOTTING_MODULES have been
+    imported, so it may import them itself at no cost.
+    """
+    placeholder = tk.Label(frame, text="Loading map…", fg='gray')
+    placeholder.pack(expand=True)
+    loaded = threading.Event()
+    failures = []
+
+    def load():
+        try:
+            for module in PLOTTING_MODULES:
+                importlib.import_module(module)
+        except Exception as exc:  # Shown in place of the map; routing still works
+            failures.append(exc)
+        finally:
+            loaded.set()
+
+    def painted(event):
+        # Children's <Map> events reach the toplevel's binding too
+        if str(event.widget) != str(master) or "first_paint" in stages:
+            return
+        master.after_idle(first_paint)
+
+    def first_paint():
+        mark("first_paint")
+        threading.Thread(target=load, name="plotting-import", daemon=True).start()
+        master.after(POLL_MS, poll)
+
+    def poll():
+        if not loaded.is_set():
+            master.after(POLL_MS, poll)
+            return
+        mark("plotting")
+        if failures:
+            placeholder.config(text=f"Map unavailable: {failures[0]}")
+            return
+        placeholder.destroy()
+        with metrics.span("figure_build"):
+            build_map()
+        master.update_idletasks()
+        mark("map_ready")
+        if metrics.enabled:
+            print("Startup: " + ", ".join(f"{stage} {seconds:.2f} s" for stage, seconds in stages.items())
+                  + " after process start", file=sys.stderr)
+
+    master.bind("<Map>", painted, add="+")
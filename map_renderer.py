@@ -0,0 +1,249 @@
+"""Persistent Matplotlib map view for the Tk navigators.
+
+The figure, canvas and static map layer are built once. A route query only
+updates a few retained "animated" artists: the highlighted path, its nodes
+and their labels. These are blitted over a cached copy of the static
+background. The background is recaptured after every full draw, such as a
+resize or a graph edit. No figures are created per query, so memory stays
+flat however many routes are shown.
+
+draw_network() paints a whole graph with one LineCollection for the edges
+and one scatter for the nodes, built from NumPy coordinate arrays. Labels
+go through LabelLayer, which only shows the most important ones inside the
+current view, so the artist count stays small even for 100k-edge maps.
+Scrolling over the map zooms around the cursor. Clicks are resolved to nodes
+by one canvas handler and a spatial lookup, not per-artist hit testing.
+"""
+import tkinter as tk
+from itertools import cycle
+from typing import List, NamedTuple
+
+import numpy as np
+from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+from matplotlib.collections import LineCollection
+from matplotlib.figure import Figure
+
+# Upper bound on node/edge labels drawn at once, whatever the zoom level
+MAX_LABELS = 60
+ANTIALIAS_MAX_EDGES = 20000
+ZOOM_STEP = 1.25
+# Click radius, in pixels, within which a node counts as clicked
+PICK_TOLERANCE = 10
+# Alternative routes, in rank order, drawn beneath the main route
+ALTERNATIVE_COLORS = ('tab:blue', 'tab:green', 'tab:purple', 'tab:orange', 'tab:cyan')
+
+
+class MapRenderer:
+    def __init__(self, master, draw_static, figsize=(10, 8), dpi=100,
+                 path_color='red', path_width=2.0, path_alpha=1.0,
+                 node_color=None, node_size=300, label_style=None):
+        # draw_static(ax) paints everything that does not change per query
+        self._draw_static = draw_static
+        self.figure = Figure(figsize=figsize, dpi=dpi)
+        self.ax = self.figure.add_subplot()
+        self.canvas = FigureCanvasTkAgg(self.figure, master=master)
+        self.canvas.get_tk_widget().pack(expand=True, fill=tk.BOTH)
+
+        self._path_color = path_color
+        self._path_style = dict(colors=path_color, linewidths=path_width, alpha=path_alpha)
+        self._node_style = dict(c=node_color, s=node_size) if node_color else None
+        self._label_style = label_style
+        self._path_points = []
+        self._path_labels = []
+        self._alternatives = []
+        self._labels = []
+        self._background = None
+
+        self.canvas.mpl_connect('draw_event', self._on_draw)
+        self.canvas.mpl_connect('scroll_event', self._on_scroll)
+        self.redraw_static()
+
+    def redraw_static(self):
+        """Repaint the static layer, e.g. after the graph itself changed."""
+        self.ax.clear()
+        self._labels = []
+        self._draw_static(self.ax)
+        # Animated artists are skipped by normal draws and only ever blitted
+        self._path_lines = LineCollection([], animated=True, zorder=3, **self._path_style)
+        self.ax.add_collection(self._path_lines)
+        self._path_nodes = None
+        if self._node_style:
+            self._path_nodes = self.ax.scatter([], [], animated=True, zorder=4, **self._node_style)
+        self._apply_path()
+        self.canvas.draw()
+
+    def show_path(self, points, labels=(), alternatives=()):
+        """Highlight the polyline through points, optionally labelling them.
+
+        alternatives are further polylines, drawn underneath in
+        ALTERNATIVE_COLORS order.
+        """
+        self._path_points = list(points)
+        self._path_labels = list(labels)
+        self._alternatives = [list(line) for line in alternatives]
+        self._apply_path()
+        self._blit()
+
+    def on_node_click(self, locate, callback, tolerance=PICK_TOLERANCE):
+        """Call callback(node) for left clicks within tolerance pixels of a node.
+
+        locate(x, y, max_distance) returns the nearest node to a point in data
+        coordinates, or None, e.g. RoutingEngine.snap.
+        """
+        def on_press(event):
+            if event.inaxes is not self.ax or event.button != 1:
+                return
+            node = locate(event.xdata, event.ydata, self._pixels_to_data(event, tolerance))
+            if node is not None:
+                callback(node)
+        return self.canvas.mpl_connect('button_press_event', on_press)
+
+    def _pixels_to_data(self, event, pixels):
+        # Axes may scale x and y differently; take the more generous one
+        to_data = self.ax.transData.inverted()
+        x, y = to_data.transform((event.x + pixels, event.y + pixels))
+        return max(abs(x - event.xdata), abs(y - event.ydata))
+
+    def _apply_path(self):
+        points = self._path_points
+        lines = list(zip(self._alternatives, cycle(ALTERNATIVE_COLORS)))
+        # Reversed so the best alternative is drawn over the worse ones, and
+        # the main route over them all
+        lines = lines[::-1] + [(points, self._path_color)]
+        lines = [(line, color) for line, color in lines if len(line) > 1]
+        self._path_lines.set_segments([line for line, _ in lines])
+        self._path_lines.set_color([color for _, color in lines])
+        if self._path_nodes is not None:
+            self._path_nodes.set_offsets(points if points else np.empty((0, 2)))
+        if self._label_style is None:
+            return
+        labels = self._path_labels
+        # Reuse a bounded pool of text artists instead of creating new ones
+        while len(self._labels) < len(labels):
+            text = self.ax.text(0, 0, '', animated=True, zorder=5, **self._label_style)
+            self._labels.append(text)
+        for i, text in enumerate(self._labels):
+            if i < len(labels):
+                text.set_position(points[i])
+                text.set_text(labels[i])
+                text.set_visible(True)
+            else:
+                text.set_visible(False)
+
+    def _overlay(self):
+        yield self._path_lines
+        if self._path_nodes is not None:
+            yield self._path_nodes
+        yield from self._labels
+
+    def _on_draw(self, event):
+        self._background = self.canvas.copy_from_bbox(self.figure.bbox)
+        self._draw_overlay()
+
+    def _draw_overlay(self):
+        for artist in self._overlay():
+            self.ax.draw_artist(artist)
+
+    def _on_scroll(self, event):
+        if event.inaxes is not self.ax:
+            return
+        scale = 1 / ZOOM_STEP if event.button == 'up' else ZOOM_STEP
+        x0, x1 = self.ax.get_xlim()
+        y0, y1 = self.ax.get_ylim()
+        x, y = event.xdata, event.ydata
+        self.ax.set_xlim(x - (x - x0) * scale, x + (x1 - x) * scale)
+        self.ax.set_ylim(y - (y - y0) * scale, y + (y1 - y) * scale)
+        self.canvas.draw_idle()
+
+    def _blit(self):
+        if self._background is None:
+            self.canvas.draw()
+            return
+        self.canvas.restore_region(self._background)
+        self._draw_overlay()
+        self.canvas.blit(self.figure.bbox)
+
+
+class LabelLayer:
+    """Zoom-dependent labels: the top-priority points inside the view only.
+
+    A fixed pool of text artists is repositioned whenever the axes limits
+    change, so a map with 100k candidate labels still draws at most
+    max_labels of them.
+    """
+
+    def __init__(self, ax, points, texts, priority=None, max_labels=MAX_LABELS, **style):
+        self.ax = ax
+        self.points = np.asarray(points, dtype=float).reshape(-1, 2)
+        self.texts = list(texts)
+        self.priority = (np.zeros(len(self.texts)) if priority is None
+                         else np.asarray(priority, dtype=float))
+        self.max_labels = max_labels
+        self._pool = [ax.text(0, 0, '', visible=False, clip_on=True, **style)
+                      for _ in range(min(max_labels, len(self.texts)))]
+        ax.callbacks.connect('xlim_changed', self.update)
+        ax.callbacks.connect('ylim_changed', self.update)
+        self.update()
+
+    def visible_indices(self):
+        (x0, x1), (y0, y1) = sorted(self.ax.get_xlim()), sorted(self.ax.get_ylim())
+        xs, ys = self.points[:, 0], self.points[:, 1]
+        inside = np.flatnonzero((xs >= x0) & (xs <= x1) & (ys >= y0) & (ys <= y1))
+        if len(inside) > self.max_labels:
+            # argpartition picks the top priorities without a full sort
+            top = np.argpartition(-self.priority[inside], self.max_labels - 1)[:self.max_labels]
+            inside = inside[top]
+        return inside
+
+    def update(self, *_):
+        shown = self.visible_indices()
+        for text, i in zip(self._pool, shown):
+            text.set_position(self.points[i])
+            text.set_text(self.texts[i])
+            text.set_visible(True)
+        for text in self._pool[len(shown):]:
+            text.set_visible(False)
+
+
+class NetworkArtists(NamedTuple):
+    nodes: object
+    edges: LineCollection
+    # Holding the layers keeps their axes callbacks alive (the registry
+    # only keeps weak references to bound methods)
+    labels: List[LabelLayer]
+
+
+def draw_network(ax, names, positions, edges, node_style, edge_style,
+                 label_style=None, label_priority=None, edge_label_style=None,
+                 max_labels=MAX_LABELS):
+    """Draw a graph as one edge LineCollection and one node scatter.
+
+    names fixes the node order and must all have an entry in positions
+    (name -> (x, y)); edges yields (u, v, weight). The node scatter's point
+    indices follow names.
+    """
+    index = {name: i for i, name in enumerate(names)}
+    coords = np.array([positions[name] for name in names], dtype=float).reshape(-1, 2)
+    # Roads to nodes without a known position cannot be drawn
+    edges = [edge for edge in edges if edge[0] in index and edge[1] in index]
+    ends = np.array([(index[u], index[v]) for u, v, _ in edges], dtype=np.intp).reshape(-1, 2)
+    segments = coords[ends]
+
+    edge_style = dict(edge_style)
+    # Antialiasing is the largest cost when rasterizing very many edges
+    edge_style.setdefault('antialiaseds', len(segments) <= ANTIALIAS_MAX_EDGES)
+    edge_artist = LineCollection(segments, zorder=1, **edge_style)
+    ax.add_collection(edge_artist)
+    node_artist = ax.scatter(coords[:, 0], coords[:, 1], zorder=2, **node_style)
+    if len(coords):
+        ax.update_datalim(coords)
+        ax.autoscale_view()
+
+    labels = []
+    if label_style is not None:
+        labels.append(LabelLayer(ax, coords, [str(name) for name in names], label_priority,
+                                 max_labels, zorder=3, **label_style))
+    if edge_label_style is not None and edges:
+        labels.append(LabelLayer(ax, segments.mean(axis=1), [f"{weight:g}" for _, _, weight in edges],
+                                 None, max_labels, zorder=3, **edge_label_style))
+    return NetworkArtists(node_artist, edge_artist, labels)
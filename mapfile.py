@@ -0,0 +1,109 @@
+"""Versioned binary map format that loads by memory-mapping.
+
+Layout (little-endian, every section 8-byte aligned):
+
+    header        magic, version, counts and the byte offset of each section
+    names         UTF-8 node names separated by NUL bytes
+    coords        float64[n, 2], NaN where a node has no position
+    offsets       int64[n + 1] CSR row offsets
+    neighbors     int32[m] CSR column indices (each undirected edge twice)
+    weights       float64[m]
+
+Loading maps the file read-only and wraps the sections with np.frombuffer,
+so the routing arrays are used in place. Worker processes that open the same
+file share one copy through the page cache.
+"""
+import mmap
+import struct
+
+import numpy as np
+
+from csr_graph import CSRGraph
+from routing import RoutingEngine
+
+MAGIC = b"PFMAP\0\0\0"
+VERSION = 1
+# magic, version, flags, node count, slot count, name section bytes,
+# then the offsets of the five sections in layout order
+HEADER = struct.Struct("<8sIIQQQ5Q")
+ALIGNMENT = 8
+
+
+class MapFormatError(ValueError):
+    pass
+
+
+def _align(position: int) -> int:
+    return (position + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def save_map(path, engine: RoutingEngine) -> None:
+    csr = engine.frozen()
+    for name in csr.names:
+        if not isinstance(name, str) or "\0" in name:
+            raise TypeError(f"Map files store NUL-free string node names, got {name!r}")
+    blob = "\0".join(csr.names).encode("utf-8")
+    coords = csr.coords if csr.coords is not None else np.full((csr.node_count, 2), np.nan)
+
+    sections = [
+        blob,
+        np.ascontiguousarray(coords, dtype="<f8").tobytes(),
+        np.ascontiguousarray(csr.offsets, dtype="<i8").tobytes(),
+        np.ascontiguousarray(csr.neighbors, dtype="<i4").tobytes(),
+        np.ascontiguousarray(csr.weights, dtype="<f8").tobytes(),
+    ]
+    positions = []
+    cursor = _align(HEADER.size)
+    for data in sections:
+        positions.append(cursor)
+        cursor = _align(cursor + len(data))
+
+    with open(path, "wb") as handle:
+        handle.write(HEADER.pack(MAGIC, VERSION, 0, csr.node_count, len(csr.neighbors),
+                                 len(blob), *positions))
+        for position, data in zip(positions, sections):
+            handle.write(b"\0" * (position - handle.tell()))
+            handle.write(data)
+
+
+def load_map(path, cache_size: int = 256) -> RoutingEngine:
+    with open(path, "rb") as handle:
+        try:
+            mapped = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise MapFormatError(f"{path} is empty") from None
+    # The arrays below keep the mapping alive; no explicit close is needed
+    if len(mapped) < HEADER.size:
+        raise MapFormatError(f"{path} is too short to be a map file")
+    magic, version, _, n, m, blob_size, *positions = HEADER.unpack_from(mapped)
+    if magic != MAGIC:
+        raise MapFormatError(f"{path} is not a map file")
+    if version != VERSION:
+        raise MapFormatError(f"Unsupported map format version {version}")
+    names_at, coords_at, offsets_at, neighbors_at, weights_at = positions
+
+    # A truncated or damaged file must fail here, not as an IndexError mid-query
+    sections = ((names_at, blob_size), (coords_at, 16 * n), (offsets_at, 8 * (n + 1)),
+                (neighbors_at, 4 * m), (weights_at, 8 * m))
+    for start, size in sections:
+        if start + size > len(mapped):
+            raise MapFormatError(f"{path} is truncated")
+    try:
+        names = mapped[names_at:names_at + blob_size].decode("utf-8").split("\0") if n else []
+    except UnicodeDecodeError:
+        raise MapFormatError(f"{path} has corrupt node names") from None
+    if len(names) != n:
+        raise MapFormatError(f"{path} has {len(names)} names for {n} nodes")
+
+    try:
+        coords = np.frombuffer(mapped, dtype="<f8", count=2 * n, offset=coords_at).reshape(n, 2)
+        offsets = np.frombuffer(mapped, dtype="<i8", count=n + 1, offset=offsets_at)
+        neighbors = np.frombuffer(mapped, dtype="<i4", count=m, offset=neighbors_at)
+        weights = np.frombuffer(mapped, dtype="<f8", count=m, offset=weights_at)
+    except ValueError as exc:
+        raise MapFormatError(f"{path} is damaged: {exc}") from None
+    if offsets[0] != 0 or offsets[-1] != m or (np.diff(offsets) < 0).any():
+        raise MapFormatError(f"{path} has inconsistent adjacency offsets")
+    if m and (neighbors.min() < 0 or neighbors.max() >= n):
+        raise MapFormatError(f"{path} has out-of-range neighbour indices")
+    return RoutingEngine.from_csr(CSRGraph(names, offsets, neighbors, weights, coords), cache_size)
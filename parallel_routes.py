@@ -0,0 +1,99 @@
+"""Multi-core route evaluation over one shared, read-only CSR graph.
+
+The CSR arrays are copied once into multiprocessing.shared_memory blocks.
+Each worker process attaches to those blocks when it starts, so tasks carry
+only their origin/destination pairs and never the graph. Pairs are sharded
+by origin, so the one-Dijkstra-per-origin grouping of batch_routes still
+applies inside every worker.
+"""
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from batch_routes import Pair, Result, route_pairs
+from csr_graph import CSRGraph
+
+# Shards per worker; more than one evens out origins with very different costs
+SHARDS_PER_WORKER = 4
+
+_ARRAYS = ("offsets", "neighbors", "weights")
+
+# Per-worker state set up by _attach
+_graph: Optional[CSRGraph] = None
+_blocks: List[shared_memory.SharedMemory] = []
+
+
+def _attach(specs, names) -> None:
+    global _graph
+    arrays = {}
+    for field, (block_name, dtype, length) in zip(_ARRAYS, specs):
+        # Workers share the parent's resource tracker, which unlinks the
+        # blocks only when the parent does
+        block = shared_memory.SharedMemory(name=block_name)
+        _blocks.append(block)
+        arrays[field] = np.ndarray((length,), dtype=dtype, buffer=block.buf)
+    _graph = CSRGraph(names, arrays["offsets"], arrays["neighbors"], arrays["weights"])
+
+
+def _solve_shard(pairs: Sequence[Pair]) -> List[Result]:
+    return route_pairs(_graph, pairs)
+
+
+class ParallelRouter:
+    def __init__(self, csr: CSRGraph, workers: Optional[int] = None):
+        self.workers = workers or os.cpu_count() or 1
+        self._blocks = []
+        specs = []
+        try:
+            for field in _ARRAYS:
+                array = getattr(csr, field)
+                block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+                self._blocks.append(block)
+                np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[:] = array
+                specs.append((block.name, array.dtype.str, len(array)))
+            self._pool = ProcessPoolExecutor(self.workers, initializer=_attach,
+                                             initargs=(specs, csr.names))
+        except BaseException:
+            self._release()
+            raise
+
+    def route_pairs(self, pairs: Sequence[Pair]) -> List[Result]:
+        """Route every pair across the pool; results come back in input order."""
+        by_origin: Dict[str, List[int]] = defaultdict(list)
+        for position, (origin, _) in enumerate(pairs):
+            by_origin[origin].append(position)
+
+        # Greedy balancing: biggest origin groups first, each onto the
+        # currently lightest shard
+        shard_count = min(len(by_origin), self.workers * SHARDS_PER_WORKER) or 1
+        shards: List[List[int]] = [[] for _ in range(shard_count)]
+        for positions in sorted(by_origin.values(), key=len, reverse=True):
+            min(shards, key=len).extend(positions)
+
+        futures = [(shard, self._pool.submit(_solve_shard, [pairs[i] for i in shard]))
+                   for shard in shards if shard]
+        results: List[Optional[Result]] = [None] * len(pairs)
+        for shard, future in futures:
+            for position, result in zip(shard, future.result()):
+                results[position] = result
+        return results
+
+    def close(self) -> None:
+        self._pool.shutdown()
+        self._release()
+
+    def _release(self) -> None:
+        for block in self._blocks:
+            block.close()
+            block.unlink()
+        self._blocks = []
+
+    def __enter__(self) -> "ParallelRouter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -1,10 +1,17 @@
 import tkinter as tk
-from tkinter import ttk, messagebox, simpledialog
-import networkx as nx
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import heapq
-import random
+from tkinter import ttk, messagebox, simpledialog, filedialog
+import os
+import time
+from functools import partial
+import lazy_startup
+import mapfile
+from layout import force_layout
+from instrumentation import metrics
+from route_worker import RouteWorker, SearchIndicator
+from routing import RoutingEngine
+
+MAP_FILETYPES = [("Campus maps", "*.pfmap"), ("All files", "*")]
+HIERARCHY_SUFFIX = ".ch"
 
 class AdvancedPathFinder:
     def __init__(self, master):
@@ -13,8 +20,12 @@ class AdvancedPathFinder:
         master.geometry("1200x800")
 
         # Graph representation
-        self.graph = nx.Graph()
-        self.node_positions = {}
+        self.router = RoutingEngine()
+        self.node_positions = self.router.positions
+        self.renderer = None
+        self.shown_path = []
+        self.network = None
+        self.worker = RouteWorker(master)
         self.initialize_campus_graph()
 
         # Create UI components
@@ -29,11 +40,6 @@ class AdvancedPathFinder:
             "Administration Building"
         ]
 
-        # Add nodes with random positions
-        for building in buildings:
-            self.graph.add_node(building)
-            self.node_positions[building] = (random.uniform(0, 1), random.uniform(0, 1))
-
         # Add edges with varying distances
         edges = [
             ("Computer Science Building", "Library", 5),
@@ -49,8 +55,17 @@ class AdvancedPathFinder:
             ("Administration Building", "Library", 3)
         ]
 
+        for building in buildings:
+            self.router.add_node(building)
         for start, end, distance in edges:
-            self.graph.add_edge(start, end, weight=distance)
+            self.router.add_edge(start, end, distance)
+
+        # Position buildings so each path is drawn about as long as it is
+        for building, position in force_layout(buildings, edges).items():
+            self.router.add_node(building, position)
+
+        # The map is fixed from here on, so preprocess it for fast queries
+        self.router.build_hierarchy()
 
     def create_ui(self):
         # Left frame for controls
@@ -61,18 +76,25 @@ class AdvancedPathFinder:
         tk.Label(control_frame, text="Select Start Location:").pack()
         self.start_var = tk.StringVar()
         self.start_dropdown = ttk.Combobox(control_frame, textvariable=self.start_var, 
-                                            values=list(self.graph.nodes()))
+                                            values=self.router.nodes())
         self.start_dropdown.pack()
 
         tk.Label(control_frame, text="Select End Location:").pack()
         self.end_var = tk.StringVar()
         self.end_dropdown = ttk.Combobox(control_frame, textvariable=self.end_var, 
-                                          values=list(self.graph.nodes()))
+                                          values=self.router.nodes())
         self.end_dropdown.pack()
 
         # Find Path Button
         find_path_btn = tk.Button(control_frame, text="Find Shortest Path", command=self.find_and_display_path)
         find_path_btn.pack(pady=10)
+        self.search_indicator = SearchIndicator(control_frame)
+        self.start_var.trace_add('write', self.on_selection_change)
+        self.end_var.trace_add('write', self.on_selection_change)
+
+        # Map persistence
+        tk.Button(control_frame, text="Save Map", command=self.save_map).pack()
+        tk.Button(control_frame, text="Load Map", command=self.load_map).pack(pady=(0, 10))
 
         # Result Display
         self.result_text = tk.Text(control_frame, height=10, width=40)
@@ -82,17 +104,42 @@ class AdvancedPathFinder:
         self.graph_frame = tk.Frame(self.master)
         self.graph_frame.pack(side=tk.RIGHT, expand=True, fill=tk.BOTH)
 
-        # Initial graph visualization
-        self.visualize_graph()
+        # The map is built once the window is up, so the controls appear first
+        lazy_startup.start(self.master, self.graph_frame, self.build_map)
 
-    def dijkstra_path(self, start, end):
+    def save_map(self):
+        path = filedialog.asksaveasfilename(defaultextension=".pfmap", filetypes=MAP_FILETYPES)
+        if not path:
+            return
         try:
-            path = nx.dijkstra_path(self.graph, start, end, weight='weight')
-            path_length = nx.path_weight(self.graph, path, weight='weight')
-            return path, path_length
-        except nx.NetworkXNoPath:
-            messagebox.showerror("Error", f"No path between {start} and {end}")
-            return None, None
+            mapfile.save_map(path, self.router)
+            if self.router.hierarchy is not None:
+                self.router.hierarchy.save(path + HIERARCHY_SUFFIX)
+        except (OSError, TypeError) as exc:
+            messagebox.showerror("Error", f"Could not save map: {exc}")
+
+    def load_map(self):
+        path = filedialog.askopenfilename(filetypes=MAP_FILETYPES)
+        if not path:
+            return
+        try:
+            router = mapfile.load_map(path)
+        except (OSError, mapfile.MapFormatError) as exc:
+            messagebox.showerror("Error", f"Could not load map: {exc}")
+            return
+
+        self.router = router
+        self.node_positions = router.positions
+        # Reuse the hierarchy saved alongside the map; building one for a
+        # large map is an offline job, not something to do on open
+        if os.path.exists(path + HIERARCHY_SUFFIX):
+            self.router.build_hierarchy(path + HIERARCHY_SUFFIX)
+        self.start_dropdown['values'] = self.router.nodes()
+        self.end_dropdown['values'] = self.router.nodes()
+        self.start_var.set('')
+        self.end_var.set('')
+        self.result_text.delete(1.0, tk.END)
+        self.redraw_map()
 
     def find_and_display_path(self):
         start = self.start_var.get()
@@ -102,67 +149,93 @@ class AdvancedPathFinder:
             messagebox.showwarning("Warning", "Please select both start and end locations")
             return
 
-        path, length = self.dijkstra_path(start, end)
-        
-        if path:
+        # The search runs in the background so the window stays responsive
+        self.search_started = time.perf_counter()
+        self.search_indicator.start()
+        self.worker.submit(partial(self.router.route, start, end), self.display_path,
+                           self.show_route_error, self.search_indicator.update)
+
+    def display_path(self, route):
+        path, length = route
+        self.search_indicator.stop()
+
+        with metrics.span("text_output"):
             # Clear previous results
             self.result_text.delete(1.0, tk.END)
-            
+
             # Display path details
             self.result_text.insert(tk.END, f"Shortest Path: {' -> '.join(path)}\n")
             self.result_text.insert(tk.END, f"Total Distance: {length:.2f} units\n")
-            
-            # Visualize path on graph
+
+        # Visualize path on graph
+        with metrics.span("render"):
             self.visualize_graph(path)
+        # Click to highlighted route, including time queued behind other searches
+        metrics.observe("find_route", time.perf_counter() - self.search_started)
+
+    def on_selection_change(self, *_):
+        # A search for the old selection is no longer wanted
+        self.cancel_search()
+
+    def cancel_search(self, message="Search cancelled"):
+        if self.worker.busy:
+            self.worker.cancel()
+            self.search_indicator.stop(message)
+
+    def show_route_error(self, exc):
+        self.search_indicator.stop()
+        messagebox.showerror("Error", str(exc))
+
+    def build_map(self):
+        # Already imported in the background by lazy_startup
+        from map_renderer import MapRenderer
+        self.renderer = MapRenderer(
+            self.graph_frame, self.draw_map, figsize=(10, 8), dpi=100,
+            path_color='red', path_width=1.0, node_color='green', node_size=300,
+            label_style=dict(fontsize=12, horizontalalignment='center', verticalalignment='center')
+        )
+        self.visualize_graph(self.shown_path)
 
     def visualize_graph(self, highlight_path=None):
-        # Clear previous visualization
-        for widget in self.graph_frame.winfo_children():
-            widget.destroy()
-
-        # Create matplotlib figure
-        fig, ax = plt.subplots(figsize=(10, 8), dpi=100)
-        
-        # Draw graph
-        edge_colors = ['black'] * len(self.graph.edges())
-        node_colors = ['skyblue'] * len(self.graph.nodes())
-
-        # Highlight path if provided
-        if highlight_path:
-            path_edges = list(zip(highlight_path, highlight_path[1:]))
-            for i, (u, v) in enumerate(self.graph.edges()):
-                if (u, v) in path_edges or (v, u) in path_edges:
-                    edge_colors[i] = 'red'
-            
-            for node in highlight_path:
-                node_colors[list(self.graph.nodes()).index(node)] = 'green'
-
-        nx.draw_networkx(
-            self.graph, 
-            pos=self.node_positions, 
-            with_labels=True, 
-            node_color=node_colors,
-            edge_color=edge_colors,
-            ax=ax
-        )
+        # The map itself is drawn once and cached; a query only swaps the
+        # highlighted route drawn over it
+        path = self.shown_path = highlight_path or []
+        if self.renderer is None:
+            return  # Still loading; build_map shows the route when it is ready
+        self.renderer.show_path([self.node_positions[node] for node in path], path)
+
+    def redraw_map(self):
+        # The graph changed, so repaint the static layer and drop any stale route
+        if self.renderer is not None:
+            with metrics.span("figure_rebuild"):
+                self.renderer.redraw_static()
+        self.visualize_graph()
 
-        # Add edge weights
-        edge_labels = nx.get_edge_attributes(self.graph, 'weight')
-        nx.draw_networkx_edge_labels(self.graph, self.node_positions, edge_labels=edge_labels)
+    def draw_map(self, ax):
+        from map_renderer import draw_network
+        nodes = self.router.nodes()
+        self.network = draw_network(
+            ax, nodes, self.node_positions, self.router.edges(),
+            node_style=dict(s=300, c='skyblue'),
+            edge_style=dict(colors='black', linewidths=1.0),
+            label_style=dict(fontsize=12, horizontalalignment='center', verticalalignment='center'),
+            # Busier junctions keep their labels when zoomed out
+            label_priority=[len(self.router.neighbours(node)) for node in nodes],
+            # Add edge weights
+            edge_label_style=dict(fontsize=10, horizontalalignment='center', verticalalignment='center',
+                                  bbox=dict(boxstyle='round', ec='white', fc='white'))
+        )
 
         ax.set_title("Campus Navigation Map")
         ax.axis('off')
 
-        # Embed in Tkinter
-        canvas = FigureCanvasTkAgg(fig, master=self.graph_frame)
-        canvas_widget = canvas.get_tk_widget()
-        canvas_widget.pack(expand=True, fill=tk.BOTH)
-        canvas.draw()
-
 def main():
+    lazy_startup.mark("imports")
     root = tk.Tk()
     app = AdvancedPathFinder(root)
     root.mainloop()
+    # Stop any search still running so the process can exit
+    app.worker.shutdown()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
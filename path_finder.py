@@ -1,9 +1,16 @@
 import tkinter as tk
-from tkinter import ttk, messagebox, simpledialog
-import networkx as nx
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import random
+from tkinter import ttk, messagebox, simpledialog, filedialog
+import time
+from functools import partial
+import lazy_startup
+import mapfile
+from layout import force_layout, place
+from instrumentation import metrics
+from all_pairs import MemoryBudgetError
+from route_worker import RouteWorker, SearchIndicator
+from routing import RoutingEngine
+
+MAP_FILETYPES = [("Campus maps", "*.pfmap"), ("All files", "*")]
 
 class InteractiveCampusNavigationSystem:
     def __init__(self, master):
@@ -12,8 +19,12 @@ class InteractiveCampusNavigationSystem:
         master.geometry("1400x900")
 
         # Graph representation
-        self.graph = nx.Graph()
-        self.node_positions = {}
+        self.router = RoutingEngine()
+        self.node_positions = self.router.positions
+        self.renderer = None
+        self.shown_path = []
+        self.network = None
+        self.worker = RouteWorker(master)
 
         # Initialize graph with nodes and edges
         self.initialize_graph()
@@ -25,11 +36,6 @@ class InteractiveCampusNavigationSystem:
         # Start with initial nodes and connections
         initial_buildings = ["Main Campus", "Science Block", "Library"]
 
-        # Add nodes with random positions
-        for building in initial_buildings:
-            self.graph.add_node(building)
-            self.node_positions[building] = (random.uniform(0, 1), random.uniform(0, 1))
-
         # Add initial connections between nodes
         initial_edges = [
             ("Main Campus", "Science Block", 5),   # Distance of 5 units
@@ -37,8 +43,17 @@ class InteractiveCampusNavigationSystem:
             ("Science Block", "Library", 4)        # Distance of 4 units
         ]
 
+        for building in initial_buildings:
+            self.router.add_node(building)
         for start, end, distance in initial_edges:
-            self.graph.add_edge(start, end, weight=distance)
+            self.router.add_edge(start, end, distance)
+
+        # Position buildings so each path is drawn about as long as it is
+        for building, position in force_layout(initial_buildings, initial_edges).items():
+            self.router.add_node(building, position)
+
+        # Keep all-pairs routes precomputed; edits below repair them in place
+        self.router.precompute_all_pairs()
 
     def create_ui(self):
         main_frame = tk.Frame(self.master)
@@ -50,38 +65,45 @@ class InteractiveCampusNavigationSystem:
         tk.Label(control_frame, text="Node Management", font=('Helvetica', 12, 'bold')).pack(pady=10)
         tk.Button(control_frame, text="Add Node", command=self.add_node).pack(pady=5)
         tk.Button(control_frame, text="Add Edge", command=self.add_edge).pack(pady=5)
+        tk.Button(control_frame, text="Save Map", command=self.save_map).pack(pady=5)
+        tk.Button(control_frame, text="Load Map", command=self.load_map).pack(pady=5)
 
         tk.Label(control_frame, text="Select Start Location:").pack()
         self.start_var = tk.StringVar()
-        self.start_dropdown = ttk.Combobox(control_frame, textvariable=self.start_var, values=list(self.graph.nodes()))
+        self.start_dropdown = ttk.Combobox(control_frame, textvariable=self.start_var, values=self.router.nodes())
         self.start_dropdown.pack()
 
         tk.Label(control_frame, text="Select End Location:").pack()
         self.end_var = tk.StringVar()
-        self.end_dropdown = ttk.Combobox(control_frame, textvariable=self.end_var, values=list(self.graph.nodes()))
+        self.end_dropdown = ttk.Combobox(control_frame, textvariable=self.end_var, values=self.router.nodes())
         self.end_dropdown.pack()
 
         tk.Button(control_frame, text="Find Shortest Path", command=self.find_and_display_path).pack(pady=10)
+        self.search_indicator = SearchIndicator(control_frame)
+        self.start_var.trace_add('write', self.on_selection_change)
+        self.end_var.trace_add('write', self.on_selection_change)
         self.result_text = tk.Text(control_frame, height=10, width=40)
         self.result_text.pack()
 
         self.graph_frame = tk.Frame(main_frame)
         self.graph_frame.pack(side=tk.RIGHT, expand=True, fill=tk.BOTH)
 
-        self.visualize_graph()
+        # The map is built once the window is up, so the controls appear first
+        lazy_startup.start(self.master, self.graph_frame, self.build_map)
 
     def add_node(self):
         node_name = simpledialog.askstring("Add Node", "Enter node name:")
-        if node_name and node_name not in self.graph.nodes():
-            self.graph.add_node(node_name)
-            self.node_positions[node_name] = (random.uniform(0, 1), random.uniform(0, 1))
+        if node_name and not self.router.has_node(node_name):
+            # Placed in a gap on the map; the rest of the layout stays put
+            position = place(self.node_positions, [node_name], self.router.edges())[node_name]
+            self.router.add_node(node_name, position)
             self.update_dropdowns()
-            self.visualize_graph()
+            self.redraw_map()
         else:
             messagebox.showerror("Error", "Node already exists or invalid input!")
 
     def add_edge(self):
-        nodes = list(self.graph.nodes())
+        nodes = self.router.nodes()
         if len(nodes) < 2:
             messagebox.showerror("Error", "Need at least 2 nodes to add an edge!")
             return
@@ -109,10 +131,17 @@ class InteractiveCampusNavigationSystem:
             try:
                 weight = float(weight_entry.get())
                 if from_node and to_node and from_node != to_node:
-                    self.graph.add_edge(from_node, to_node, weight=weight)
+                    # A route found on the old graph could be out of date
+                    self.cancel_search("Search cancelled: the map changed")
+                    unconnected = [node for node in (from_node, to_node) if not self.router.neighbours(node)]
+                    self.router.add_edge(from_node, to_node, weight)
+                    # A node added before it had any paths moves next to its new neighbour
+                    for node, position in place(self.node_positions, unconnected, self.router.edges()).items():
+                        self.router.add_node(node, position)
                     edge_window.destroy()
                     self.update_dropdowns()
-                    self.visualize_graph()
+                    self.report_edge_update(from_node, to_node, weight)
+                    self.redraw_map()
                 else:
                     messagebox.showerror("Error", "Invalid selection!")
             except ValueError:
@@ -120,55 +149,125 @@ class InteractiveCampusNavigationSystem:
 
         tk.Button(edge_window, text="Add Edge", command=confirm_edge).pack(pady=10)
 
+    def report_edge_update(self, from_node, to_node, weight):
+        self.result_text.delete(1.0, tk.END)
+        self.result_text.insert(tk.END, f"Added edge: {from_node} - {to_node} ({weight:.2f})\n")
+        table = self.router.all_pairs
+        if table is not None:
+            self.result_text.insert(tk.END, f"Shortest distances updated: {table.last_touched} "
+                                            f"of {table.node_count ** 2}\n")
+
+    def save_map(self):
+        path = filedialog.asksaveasfilename(defaultextension=".pfmap", filetypes=MAP_FILETYPES)
+        if not path:
+            return
+        try:
+            mapfile.save_map(path, self.router)
+        except (OSError, TypeError) as exc:
+            messagebox.showerror("Error", f"Could not save map: {exc}")
+
+    def load_map(self):
+        path = filedialog.askopenfilename(filetypes=MAP_FILETYPES)
+        if not path:
+            return
+        try:
+            router = mapfile.load_map(path)
+        except (OSError, mapfile.MapFormatError) as exc:
+            messagebox.showerror("Error", f"Could not load map: {exc}")
+            return
+
+        self.router = router
+        self.node_positions = router.positions
+        try:
+            self.router.precompute_all_pairs()
+        except MemoryBudgetError:
+            pass  # Too large for dense tables; queries fall back to A*
+        self.update_dropdowns()
+        self.start_var.set('')
+        self.end_var.set('')
+        self.result_text.delete(1.0, tk.END)
+        self.redraw_map()
+
     def update_dropdowns(self):
-        nodes = list(self.graph.nodes())
+        nodes = self.router.nodes()
         self.start_dropdown['values'] = nodes
         self.end_dropdown['values'] = nodes
 
-    def dijkstra_path(self, start, end):
-        try:
-            path = nx.dijkstra_path(self.graph, start, end, weight='weight')
-            path_length = nx.path_weight(self.graph, path, weight='weight')
-            return path, path_length
-        except nx.NetworkXNoPath:
-            messagebox.showerror("Error", f"No path between {start} and {end}")
-            return None, None
-
     def find_and_display_path(self):
         start, end = self.start_var.get(), self.end_var.get()
         if start and end:
-            path, length = self.dijkstra_path(start, end)
-            if path:
-                self.result_text.delete(1.0, tk.END)
-                self.result_text.insert(tk.END, f"Shortest Path: {' -> '.join(path)}\n")
-                self.result_text.insert(tk.END, f"Total Distance: {length:.2f} units\n")
-                self.visualize_graph(path)
+            # Searched in the background; display_path runs once it is done
+            self.search_started = time.perf_counter()
+            self.search_indicator.start()
+            self.worker.submit(partial(self.router.route, start, end), self.display_path,
+                               self.show_route_error, self.search_indicator.update)
         else:
             messagebox.showwarning("Warning", "Select both start and end locations")
 
-    def visualize_graph(self, highlight_path=None):
-        for widget in self.graph_frame.winfo_children():
-            widget.destroy()
-
-        fig, ax = plt.subplots(figsize=(10, 8), dpi=100)
-        edge_colors = ['black'] * len(self.graph.edges())
-        node_colors = ['skyblue'] * len(self.graph.nodes())
+    def display_path(self, route):
+        path, length = route
+        self.search_indicator.stop()
+        with metrics.span("text_output"):
+            self.result_text.delete(1.0, tk.END)
+            self.result_text.insert(tk.END, f"Shortest Path: {' -> '.join(path)}\n")
+            self.result_text.insert(tk.END, f"Total Distance: {length:.2f} units\n")
+        with metrics.span("render"):
+            self.visualize_graph(path)
+        metrics.observe("find_route", time.perf_counter() - self.search_started)
+
+    def on_selection_change(self, *_):
+        # A search for the old selection is no longer wanted
+        self.cancel_search()
+
+    def cancel_search(self, message="Search cancelled"):
+        if self.worker.busy:
+            self.worker.cancel()
+            self.search_indicator.stop(message)
+
+    def show_route_error(self, exc):
+        self.search_indicator.stop()
+        messagebox.showerror("Error", str(exc))
+
+    def build_map(self):
+        # Already imported in the background by lazy_startup
+        from map_renderer import MapRenderer
+        self.renderer = MapRenderer(
+            self.graph_frame, self.draw_map, figsize=(10, 8), dpi=100,
+            path_color='red', path_width=1.0, node_color='green', node_size=300,
+            label_style=dict(fontsize=12, horizontalalignment='center', verticalalignment='center'))
+        self.visualize_graph(self.shown_path)
 
-        if highlight_path:
-            path_edges = list(zip(highlight_path, highlight_path[1:]))
-            edge_colors = ['red' if (u, v) in path_edges or (v, u) in path_edges else 'black' for u, v in self.graph.edges()]
-            node_colors = ['green' if node in highlight_path else 'skyblue' for node in self.graph.nodes()]
+    def visualize_graph(self, highlight_path=None):
+        # The map is drawn once and cached; a query only swaps the route over it
+        path = self.shown_path = highlight_path or []
+        if self.renderer is None:
+            return  # Still loading; build_map shows the route when it is ready
+        self.renderer.show_path([self.node_positions[node] for node in path], path)
+
+    def redraw_map(self):
+        # The graph changed, so repaint the static layer and drop any stale route
+        if self.renderer is not None:
+            with metrics.span("figure_rebuild"):
+                self.renderer.redraw_static()
+        self.visualize_graph()
 
-        nx.draw(self.graph, pos=self.node_positions, with_labels=True, node_color=node_colors, edge_color=edge_colors, ax=ax)
-        nx.draw_networkx_edge_labels(self.graph, self.node_positions, edge_labels=nx.get_edge_attributes(self.graph, 'weight'))
+    def draw_map(self, ax):
+        from map_renderer import draw_network
+        nodes = self.router.nodes()
+        self.network = draw_network(
+            ax, nodes, self.node_positions, self.router.edges(),
+            node_style=dict(s=300, c='skyblue'), edge_style=dict(colors='black', linewidths=1.0),
+            label_style=dict(fontsize=12, horizontalalignment='center', verticalalignment='center'),
+            label_priority=[len(self.router.neighbours(node)) for node in nodes],
+            edge_label_style=dict(fontsize=10, horizontalalignment='center', verticalalignment='center',
+                                  bbox=dict(boxstyle='round', ec='white', fc='white')))
         ax.set_title("Campus Navigation Map")
         ax.axis('off')
 
-        canvas = FigureCanvasTkAgg(fig, master=self.graph_frame)
-        canvas.get_tk_widget().pack(expand=True, fill=tk.BOTH)
-        canvas.draw()
-
 if __name__ == "__main__":
+    lazy_startup.mark("imports")
     root = tk.Tk()
     app = InteractiveCampusNavigationSystem(root)
     root.mainloop()
+    # Stop any search still running so the process can exit
+    app.worker.shutdown()
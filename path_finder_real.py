@@ -1,9 +1,33 @@
 import tkinter as tk
-from tkinter import ttk, messagebox
-import networkx as nx
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import numpy as np
+from tkinter import ttk, messagebox, filedialog
+import time
+from functools import partial
+import lazy_startup
+import mapfile
+from all_pairs import MemoryBudgetError
+from campus_hierarchy import Building, CampusHierarchy, floor_plan, label
+from campus_queries import CATEGORIES, categorize_building, nearest_facility, plan_tour
+from cost_profiles import PROFILES, rush_hours
+from instrumentation import metrics
+from route_worker import RouteWorker, SearchIndicator
+from routing import YEN_MAX_K, RoutingEngine
+
+MAP_FILETYPES = [("Campus maps", "*.pfmap"), ("All files", "*")]
+
+def library_plan():
+    return floor_plan({
+        1: [("Entrance", "Front Desk", 0.02), ("Front Desk", "Stacks A", 0.03), ("Front Desk", "Stairs", 0.02),
+            ("Entrance", "Lift", 0.02)],
+        2: [("Stairs", "Reading Room", 0.03), ("Lift", "Reading Room", 0.02), ("Reading Room", "Archives", 0.04)],
+    }, shafts=[("Stairs", 0.02), ("Lift", 0.03)])
+
+def academic_plan():
+    return floor_plan({
+        1: [("Lobby", "Lecture Hall 1", 0.03), ("Lobby", "Stairs", 0.01), ("Lobby", "Lift", 0.02)],
+        2: [("Stairs", "Room 201", 0.02), ("Room 201", "Room 202", 0.01), ("Lift", "Room 202", 0.02)],
+        3: [("Stairs", "Dean's Office", 0.03), ("Lift", "Seminar Room", 0.01),
+            ("Seminar Room", "Dean's Office", 0.02)],
+    }, shafts=[("Stairs", 0.02), ("Lift", 0.03)])
 
 class RealisticCampusNavigator:
     def __init__(self, master):
@@ -12,9 +36,13 @@ class RealisticCampusNavigator:
         master.geometry("1400x900")
 
         # Create graph with realistic layout
-        self.graph = nx.Graph()
-        self.node_positions = {}
-        self.node_artists = []
+        self.router = RoutingEngine()
+        self.node_positions = self.router.positions
+        self.node_names = []
+        self.network = None
+        self.renderer = None
+        self.shown_route = ([], ())
+        self.worker = RouteWorker(master)
         self.create_realistic_campus()
 
         # UI Setup
@@ -37,8 +65,7 @@ class RealisticCampusNavigator:
 
         # Add nodes with precise positions
         for building, pos in buildings.items():
-            self.graph.add_node(building)
-            self.node_positions[building] = pos
+            self.router.add_node(building, pos)
 
         # Comprehensive road connections to ensure connectivity
         road_connections = [
@@ -57,7 +84,22 @@ class RealisticCampusNavigator:
         ]
 
         for start, end, weight in road_connections:
-            self.graph.add_edge(start, end, weight=weight)
+            self.router.add_edge(start, end, weight)
+
+        # Stairways, and the lunch rush around the Student Center
+        for start, end in [("Main Academic Building", "Library"), ("Science Complex", "Engineering Building")]:
+            self.router.set_edge_attribute(start, end, "stairs", True)
+        for neighbour in self.router.neighbours("Student Center"):
+            self.router.set_edge_attribute("Student Center", neighbour, "crowding", rush_hours(2.0, range(11, 14)))
+
+        # The map is fixed and small, so plain-weight queries become table lookups
+        self.precompute_routes()
+
+        # Indoor plans, loaded the first time one of their rooms is listed
+        self.campus_map = CampusHierarchy(self.router)
+        self.campus_map.add_building(Building("Library", {"Library": (1, "Entrance")}, library_plan))
+        self.campus_map.add_building(Building("Main Academic Building", {"Main Academic Building": (1, "Lobby")},
+                                              academic_plan))
 
     def create_interface(self):
         # Create main frames
@@ -71,18 +113,70 @@ class RealisticCampusNavigator:
         tk.Label(left_frame, text="Start Location:").pack()
         self.start_var = tk.StringVar()
         self.start_dropdown = ttk.Combobox(left_frame, textvariable=self.start_var, 
-                                       values=list(self.graph.nodes()))
+                                       values=self.router.nodes())
         self.start_dropdown.pack(pady=5)
+        tk.Label(left_frame, text="Start Room:").pack()
+        self.start_room_var = tk.StringVar()
+        self.start_room_dropdown = ttk.Combobox(left_frame, textvariable=self.start_room_var, state='readonly')
+        self.start_room_dropdown.pack(pady=5)
 
         tk.Label(left_frame, text="End Location:").pack()
         self.end_var = tk.StringVar()
         self.end_dropdown = ttk.Combobox(left_frame, textvariable=self.end_var, 
-                                     values=list(self.graph.nodes()))
+                                     values=self.router.nodes())
         self.end_dropdown.pack(pady=5)
+        tk.Label(left_frame, text="End Room:").pack()
+        self.end_room_var = tk.StringVar()
+        self.end_room_dropdown = ttk.Combobox(left_frame, textvariable=self.end_room_var, state='readonly')
+        self.end_room_dropdown.pack(pady=5)
+
+        # How many alternative routes to list and draw
+        tk.Label(left_frame, text="Routes to Show:").pack()
+        self.route_count_var = tk.IntVar(value=1)
+        self.route_count_spinbox = tk.Spinbox(left_frame, from_=1, to=YEN_MAX_K, textvariable=self.route_count_var,
+                                              width=5, state='readonly')
+        self.route_count_spinbox.pack(pady=5)
+
+        # Costs follow stairs and crowding at the departure hour
+        tk.Label(left_frame, text="Route Profile:").pack()
+        self.profile_var = tk.StringVar(value=next(iter(PROFILES)))
+        self.profile_dropdown = ttk.Combobox(left_frame, textvariable=self.profile_var, values=list(PROFILES),
+                                             state='readonly')
+        self.profile_dropdown.pack(pady=5)
+        tk.Label(left_frame, text="Departure Hour:").pack()
+        self.departure_var = tk.IntVar(value=time.localtime().tm_hour)
+        self.departure_spinbox = tk.Spinbox(left_frame, from_=0, to=23, textvariable=self.departure_var,
+                                            width=5, state='readonly')
+        self.departure_spinbox.pack(pady=5)
 
         # Find Path Button
         find_path_btn = tk.Button(left_frame, text="Find Route", command=self.find_route)
         find_path_btn.pack(pady=10)
+        self.search_indicator = SearchIndicator(left_frame)
+        self.start_var.trace_add('write', self.on_selection_change)
+        self.end_var.trace_add('write', self.on_selection_change)
+        self.start_room_var.trace_add('write', self.update_option_states)
+        self.end_room_var.trace_add('write', self.update_option_states)
+
+        # Closest building of a category, from the start location
+        tk.Label(left_frame, text="Nearest Facility:").pack()
+        self.category_var = tk.StringVar(value=CATEGORIES[0])
+        ttk.Combobox(left_frame, textvariable=self.category_var, values=CATEGORIES,
+                     state='readonly').pack(pady=5)
+        tk.Button(left_frame, text="Find Nearest", command=self.find_nearest).pack()
+
+        # Multi-stop tour from the start location
+        tk.Label(left_frame, text="Tour Stops:").pack(pady=(10, 0))
+        self.stops_list = tk.Listbox(left_frame, selectmode=tk.MULTIPLE, height=6, exportselection=False)
+        self.stops_list.pack(pady=5)
+        self.update_stop_list()
+        self.return_var = tk.BooleanVar()
+        tk.Checkbutton(left_frame, text="Return to start", variable=self.return_var).pack()
+        tk.Button(left_frame, text="Plan Tour", command=self.find_tour).pack(pady=(0, 10))
+
+        # Map persistence
+        tk.Button(left_frame, text="Save Map", command=self.save_map).pack()
+        tk.Button(left_frame, text="Load Map", command=self.load_map).pack(pady=5)
 
         # Result display
         self.result_text = tk.Text(left_frame, height=10, width=40)
@@ -91,21 +185,44 @@ class RealisticCampusNavigator:
         # Visualization frame
         self.viz_frame = right_frame
 
-        # Initial visualization
+        # The map is built once the window is up, so the controls appear first
+        lazy_startup.start(self.master, self.viz_frame, self.build_map)
+
+    def build_map(self):
+        # Already imported in the background by lazy_startup
+        import matplotlib.style
+        from map_renderer import MapRenderer
+        matplotlib.style.use('classic')
+        self.renderer = MapRenderer(self.viz_frame, self.draw_campus, figsize=(12, 9), dpi=100,
+                                    path_color='#E74C3C', path_width=3, path_alpha=0.8)
+        # Markers are about 20 px in radius, so a click anywhere on one selects it
+        self.renderer.on_node_click(self.router.snap, self.on_building_click, tolerance=25)
+        self.visualize_campus(*self.shown_route)
+
+    def visualize_campus(self, highlight_path=None, alternatives=()):
+        # The campus is drawn once and cached; a query only swaps the route over it
+        self.shown_route = (highlight_path or [], alternatives)
+        if self.renderer is None:
+            return  # Still loading; build_map shows the route when it is ready
+        path = highlight_path or []
+        self.renderer.show_path([self.node_positions[node] for node in path],
+                                alternatives=[[self.node_positions[node] for node in route]
+                                              for route in alternatives])
+
+    def redraw_map(self):
+        # The graph changed, so repaint the static layer and drop any stale route
+        if self.renderer is not None:
+            with metrics.span("figure_rebuild"):
+                self.renderer.redraw_static()
         self.visualize_campus()
 
-    def visualize_campus(self, highlight_path=None):
-        # Clear previous visualization
-        for widget in self.viz_frame.winfo_children():
-            widget.destroy()
-
-        # Create figure with campus-like background
-        plt.style.use('classic')
-        fig, ax = plt.subplots(figsize=(12, 9), dpi=100)
+    def draw_campus(self, ax):
+        from matplotlib.patches import Rectangle
+        from map_renderer import draw_network
         ax.set_facecolor('#F5F5F5')  # Light gray background
 
         # Add campus ground texture
-        ax.add_patch(plt.Rectangle((0, 0), 1, 1, facecolor='#E0E0E0', alpha=0.5, transform=ax.transAxes))
+        ax.add_patch(Rectangle((0, 0), 1, 1, facecolor='#E0E0E0', alpha=0.5, transform=ax.transAxes))
 
         # Draw grid-like roads
         road_color = '#A0A0A0'
@@ -113,60 +230,35 @@ class RealisticCampusNavigator:
 
         # Horizontal roads
         for pos in [0.2, 0.5, 0.8]:
-            ax.add_patch(plt.Rectangle((0, pos-road_width/2), 1, road_width, 
+            ax.add_patch(Rectangle((0, pos-road_width/2), 1, road_width, 
                                         facecolor=road_color, alpha=0.5, transform=ax.transAxes))
 
         # Vertical roads
         for pos in [0.3, 0.6, 0.9]:
-            ax.add_patch(plt.Rectangle((pos-road_width/2, 0), road_width, 1, 
+            ax.add_patch(Rectangle((pos-road_width/2, 0), road_width, 1, 
                                         facecolor=road_color, alpha=0.5, transform=ax.transAxes))
 
         # Draw buildings
         building_colors = {
             "Academic": '#4A6D7C',
-            "Science": '#2C3E50',
+            "Other": '#2C3E50',
             "Support": '#34495E',
             "Residential": '#7F8C8D'
         }
 
-        def categorize_building(name):
-            if "Academic" in name or "Engineering" in name or "Science" in name:
-                return building_colors["Academic"]
-            elif "Dormitory" in name:
-                return building_colors["Residential"]
-            elif "Library" or "Student Center" in name:
-                return building_colors["Support"]
-            else:
-                return building_colors["Science"]
-
-        # Plot nodes (buildings)
-        self.node_artists = []
-        for building, pos in self.node_positions.items():
-            color = categorize_building(building)
-            size = 1000 if "Main" in building else 600
-            scatter = ax.scatter(pos[0], pos[1], s=size, c=color, alpha=0.7, 
-                                 edgecolors='white', picker=5, label=building)
-            label = ax.text(pos[0], pos[1], building, fontsize=8, 
-                    horizontalalignment='center', verticalalignment='center', 
-                    color='white', fontweight='bold')
-            
-            self.node_artists.append((scatter, building))
-
-        # Draw edges (roads)
-        for (u, v, d) in self.graph.edges(data=True):
-            start = self.node_positions[u]
-            end = self.node_positions[v]
-            ax.plot([start[0], end[0]], [start[1], end[1]], 
-                    color='#BDC3C7', linestyle='--', linewidth=1, alpha=0.5)
-
-        # Highlight path if provided
-        if highlight_path:
-            path_edges = list(zip(highlight_path, highlight_path[1:]))
-            for u, v in path_edges:
-                start = self.node_positions[u]
-                end = self.node_positions[v]
-                ax.plot([start[0], end[0]], [start[1], end[1]], 
-                        color='#E74C3C', linewidth=3, alpha=0.8)
+        # Plot all buildings as one scatter and all roads as one collection
+        self.node_names = list(self.node_positions)
+        self.network = draw_network(
+            ax, self.node_names, self.node_positions, self.router.edges(),
+            node_style=dict(s=[1000 if "Main" in building else 600 for building in self.node_names],
+                            c=[building_colors[categorize_building(building)] for building in self.node_names],
+                            alpha=0.7, edgecolors='white'),
+            edge_style=dict(colors='#BDC3C7', linestyles='--', linewidths=1, alpha=0.5),
+            label_style=dict(fontsize=8, horizontalalignment='center', verticalalignment='center',
+                             color='white', fontweight='bold'),
+            # Main buildings keep their labels longest when zoomed out
+            label_priority=[2 if "Main" in building else 1 for building in self.node_names]
+        )
 
         # Styling
         ax.set_title("Campus Navigation Map", fontsize=16, fontweight='bold')
@@ -174,35 +266,54 @@ class RealisticCampusNavigator:
         ax.set_ylim(0, 1)
         ax.axis('off')
 
-        # Connect pick event
-        def on_pick(event):
-            # If start location is empty, set it
-            if not self.start_var.get():
-                for artist, building in self.node_artists:
-                    if artist == event.artist:
-                        self.start_var.set(building)
-                        break
-            # If start is set but end is empty, set end
-            elif not self.end_var.get():
-                for artist, building in self.node_artists:
-                    if artist == event.artist:
-                        self.end_var.set(building)
-                        break
-            # If both are set, reset start
-            else:
-                for artist, building in self.node_artists:
-                    if artist == event.artist:
-                        self.start_var.set(building)
-                        self.end_var.set('')
-                        break
-
-        fig.canvas.mpl_connect('pick_event', on_pick)
-
-        # Embed in Tkinter
-        canvas = FigureCanvasTkAgg(fig, master=self.viz_frame)
-        canvas_widget = canvas.get_tk_widget()
-        canvas_widget.pack(expand=True, fill=tk.BOTH)
-        canvas.draw()
+    def on_building_click(self, building):
+        # If start location is empty, set it
+        if not self.start_var.get():
+            self.start_var.set(building)
+        # If start is set but end is empty, set end
+        elif not self.end_var.get():
+            self.end_var.set(building)
+        # If both are set, reset start
+        else:
+            self.start_var.set(building)
+            self.end_var.set('')
+
+    def save_map(self):
+        path = filedialog.asksaveasfilename(defaultextension=".pfmap", filetypes=MAP_FILETYPES)
+        if not path:
+            return
+        try:
+            mapfile.save_map(path, self.router)
+        except (OSError, TypeError) as exc:
+            messagebox.showerror("Error", f"Could not save map: {exc}")
+
+    def load_map(self):
+        path = filedialog.askopenfilename(filetypes=MAP_FILETYPES)
+        if not path:
+            return
+        try:
+            router = mapfile.load_map(path)
+        except (OSError, mapfile.MapFormatError) as exc:
+            messagebox.showerror("Error", f"Could not load map: {exc}")
+            return
+
+        self.router = router
+        self.campus_map = CampusHierarchy(router)
+        self.node_positions = router.positions
+        self.precompute_routes()
+        self.start_dropdown['values'] = self.router.nodes()
+        self.end_dropdown['values'] = self.router.nodes()
+        self.update_stop_list()
+        self.start_var.set('')
+        self.end_var.set('')
+        self.result_text.delete(1.0, tk.END)
+        self.redraw_map()
+
+    def precompute_routes(self):
+        try:
+            self.router.precompute_all_pairs()
+        except MemoryBudgetError:
+            pass  # Too large for dense tables; queries fall back to A*
 
     def find_route(self):
         start = self.start_var.get()
@@ -212,26 +323,128 @@ class RealisticCampusNavigator:
             messagebox.showwarning("Warning", "Select both start and end locations")
             return
 
-        try:
-            # Find shortest path
-            path = nx.shortest_path(self.graph, start, end, weight='weight')
-            path_length = nx.path_weight(self.graph, path, weight='weight')
+        # Find shortest path in the background; show_route runs when it is done
+        start_room, end_room = self.room(start, self.start_room_var.get()), self.room(end, self.end_room_var.get())
+        count = self.route_count_var.get()
+        if start_room or end_room:
+            # Only the start and end buildings' indoor plans are searched
+            self.run_search(partial(self.campus_map.route, start_room or start, end_room or end), self.show_route)
+        elif count > 1:
+            self.run_search(partial(self.router.alternatives, start, end, count, **self.cost_options()),
+                            self.show_alternatives)
+        else:
+            self.run_search(partial(self.router.route, start, end, **self.cost_options()), self.show_route)
+
+    def find_nearest(self):
+        start, category = self.start_var.get(), self.category_var.get()
+        if not start:
+            messagebox.showwarning("Warning", "Select a start location")
+            return
+        # One search reaches the closest building of the category
+        self.run_search(partial(nearest_facility, self.router, start, category, **self.cost_options()),
+                        lambda route: self.show_route(route, f"Nearest {category}: {route[0][-1]}"))
 
+    def find_tour(self):
+        start = self.start_var.get()
+        stops = [self.stops_list.get(i) for i in self.stops_list.curselection()]
+        if not start or not stops:
+            messagebox.showwarning("Warning", "Select a start location and at least one stop")
+            return
+        self.run_search(partial(plan_tour, self.router, start, stops, self.return_var.get(),
+                                **self.cost_options()),
+                        lambda tour: self.show_route(tour[1], f"Stop order: {' → '.join(tour[0])}"))
+
+    def room_names(self, building):
+        # Room label -> indoor node, for buildings with an indoor plan
+        if building not in self.campus_map.buildings:
+            return {}
+        return {f"Floor {floor}: {room}": (floor, room) for floor, room in self.campus_map.rooms(building)}
+
+    def room(self, building, name):
+        rooms = self.room_names(building)
+        return (building, rooms[name]) if name in rooms else None
+
+    def update_room_lists(self):
+        for building, room_var, dropdown in [(self.start_var.get(), self.start_room_var, self.start_room_dropdown),
+                                             (self.end_var.get(), self.end_room_var, self.end_room_dropdown)]:
+            rooms = [''] + sorted(self.room_names(building))
+            dropdown['values'] = rooms
+            if room_var.get() not in rooms:
+                room_var.set('')
+
+    def update_option_states(self, *_):
+        # Indoor routes are single, plain-distance routes, so these do not apply
+        state = 'disabled' if self.start_room_var.get() or self.end_room_var.get() else 'readonly'
+        for widget in (self.route_count_spinbox, self.profile_dropdown, self.departure_spinbox):
+            widget.config(state=state)
+
+    def cost_options(self):
+        return dict(profile=self.profile_var.get(), departure=self.departure_var.get())
+
+    def run_search(self, search, on_done):
+        self.search_started = time.perf_counter()
+        self.search_indicator.start()
+        self.worker.submit(search, on_done, self.show_route_error, self.search_indicator.update)
+
+    def update_stop_list(self):
+        self.stops_list.delete(0, tk.END)
+        for building in self.router.nodes():
+            self.stops_list.insert(tk.END, building)
+
+    def show_route(self, route, summary=None):
+        path, path_length = route
+        self.search_indicator.stop()
+
+        with metrics.span("text_output"):
             # Clear previous results
             self.result_text.delete(1.0, tk.END)
-            self.result_text.insert(tk.END, f"Route: {' → '.join(path)}\n")
+            if summary:
+                self.result_text.insert(tk.END, f"{summary}\n")
+            self.result_text.insert(tk.END, f"Route: {' → '.join(label(step) for step in path)}\n")
             self.result_text.insert(tk.END, f"Total Distance: {path_length:.2f} units\n")
 
-            # Visualize route
-            self.visualize_campus(path)
+        # Visualize route
+        with metrics.span("render"):
+            # Indoor steps have no place on the campus map
+            self.visualize_campus([step for step in path if step in self.node_positions])
+        metrics.observe("find_route", time.perf_counter() - self.search_started)
+
+    def show_alternatives(self, routes):
+        from map_renderer import ALTERNATIVE_COLORS
+        self.search_indicator.stop()
+        colors = ['red'] + [color.replace('tab:', '') for color in ALTERNATIVE_COLORS]
+
+        with metrics.span("text_output"):
+            self.result_text.delete(1.0, tk.END)
+            for rank, ((path, path_length), color) in enumerate(zip(routes, colors), 1):
+                self.result_text.insert(tk.END, f"Route {rank} ({color}, {path_length:.2f} units): "
+                                                f"{' → '.join(path)}\n")
+
+        with metrics.span("render"):
+            self.visualize_campus(routes[0][0], [path for path, _ in routes[1:]])
+        metrics.observe("find_route", time.perf_counter() - self.search_started)
+
+    def on_selection_change(self, *_):
+        # A search for the old selection is no longer wanted
+        self.cancel_search()
+        self.update_room_lists()
+
+    def cancel_search(self, message="Search cancelled"):
+        if self.worker.busy:
+            self.worker.cancel()
+            self.search_indicator.stop(message)
 
-        except nx.NetworkXNoPath:
-            messagebox.showerror("Error", "No route found between locations")
+    def show_route_error(self, exc):
+        self.search_indicator.stop()
+        messagebox.showerror("Error", str(exc))
 
 def main():
+    lazy_startup.mark("imports")
     root = tk.Tk()
     app = RealisticCampusNavigator(root)
     root.mainloop()
+    # Stop any search still running so the process can exit
+    app.worker.shutdown()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,82 @@
+"""Bounded LRU cache of computed routes with edge-precise invalidation."""
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+Node = Hashable
+Route = Tuple[List[Node], float]
+
+
+class RouteCache:
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        # frozenset({start, end}) -> (path, cost); the graph is undirected, so
+        # one entry answers both directions
+        self._entries: "OrderedDict[frozenset, Route]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, start: Node, end: Node) -> Optional[Route]:
+        key = frozenset((start, end))
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        path, cost = entry
+        if path[0] != start:
+            path = path[::-1]
+        return list(path), cost
+
+    def put(self, start: Node, end: Node, path: List[Node], cost: float) -> None:
+        if self.maxsize <= 0:
+            return
+        key = frozenset((start, end))
+        self._entries[key] = (list(path), cost)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self._entries), "maxsize": self.maxsize, "hits": self.hits,
+                "misses": self.misses, "invalidations": self.invalidations}
+
+    def invalidate_edge(self, u: Node, v: Node, old_weight: Optional[float], new_weight: float,
+                        distances: Callable[[Node], Dict[Node, float]]) -> int:
+        """Drop exactly the cached routes that an edge insert or reweight changes.
+
+        distances(node) must return shortest distances from node in the graph
+        as it was before the edit. It is called only when the edge got
+        cheaper, because only then can the edit shorten routes that never
+        used the edge. Returns the number of entries dropped.
+        """
+        if not self._entries or new_weight == old_weight:
+            return 0
+        if old_weight is not None and new_weight > old_weight:
+            # A costlier edge only hurts routes that actually traverse it
+            stale = [key for key, (path, _) in self._entries.items() if _uses_edge(path, u, v)]
+        else:
+            from_u, from_v = distances(u), distances(v)
+            inf = float("inf")
+            stale = []
+            for key, (path, cost) in self._entries.items():
+                s, t = path[0], path[-1]
+                through = min(from_u.get(s, inf) + new_weight + from_v.get(t, inf),
+                              from_v.get(s, inf) + new_weight + from_u.get(t, inf))
+                if through < cost:
+                    stale.append(key)
+        for key in stale:
+            del self._entries[key]
+        self.invalidations += len(stale)
+        return len(stale)
+
+
+def _uses_edge(path: List[Node], u: Node, v: Node) -> bool:
+    return any((a == u and b == v) or (a == v and b == u) for a, b in zip(path, path[1:]))
@@ -0,0 +1,383 @@
+"""Serve routes over HTTP/JSON for kiosks and the web app.
+
+    python route_server.py --map campus.pfmap --port 8080
+
+The map is loaded once at startup. Endpoints take query-string parameters
+(or, for POST, the same names in a JSON body):
+
+    GET  /route?origin=A&destination=B[&k=3][&method=astar][&profile=Step-free][&departure=12]
+    GET  /nearest?origin=A&category=Support[&profile=...][&departure=...]
+    POST /batch    {"pairs": [["A", "B"], ...], "profile": ..., "departure": ...}
+    GET  /metrics  Prometheus text, or JSON with ?format=json
+
+Connections are kept alive (HTTP/1.1 by default, or 1.0 with a keep-alive
+header) and may pipeline requests. Searches run one at a time on a worker
+thread, so the event loop keeps accepting and parsing while one is under
+way. Identical /route and /nearest queries that arrive while the same one
+is still being computed wait for that computation instead of starting
+their own. The map never changes while serving, so their encoded answers
+are also kept in an LRU and repeats are answered without leaving the loop.
+
+Throughput depends on how a route is found. Cached answers, table walks and
+hierarchy queries reach thousands of requests per second. An uncached A*
+search on a large map does not: varied queries on a 40k-node grid manage
+about 130 per second. So --precompute defaults to auto, which uses all-pairs
+tables when they fit in memory. Otherwise it uses the contraction hierarchy
+saved next to the map (<map>.ch, also written by the Advanced navigator's
+Save Map). Building a hierarchy for a large map takes minutes, so that is
+done once with --precompute ch, which saves it for later runs. Profile
+queries always search with A*. A /route method of ch or table is refused
+with 400 unless that hierarchy or table was built at startup.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+import mapfile
+from all_pairs import MemoryBudgetError
+from batch_routes import route_pairs
+from campus_queries import nearest_facility
+from instrumentation import metrics
+from routing import NoRouteError, RoutingEngine, RoutingError, UnknownLocationError
+
+DEFAULT_PORT = 8080
+# Saved next to the map file, as the Advanced navigator does
+HIERARCHY_SUFFIX = ".ch"
+# Idle keep-alive connections are closed after this many seconds
+KEEP_ALIVE_TIMEOUT = 15.0
+MAX_BODY_BYTES = 4 * 1024 * 1024
+MAX_HEADERS = 100
+MAX_BATCH_PAIRS = 100000
+RESPONSE_CACHE_SIZE = 4096
+
+
+class HTTPError(Exception):
+    def __init__(self, status: HTTPStatus, message: Optional[str] = None):
+        super().__init__(message or status.phrase)
+        self.status = status
+
+
+Response = Tuple[HTTPStatus, bytes, str]
+
+
+def json_response(payload, status: HTTPStatus = HTTPStatus.OK) -> Response:
+    return status, json.dumps(payload, ensure_ascii=False).encode("utf-8"), "application/json"
+
+
+def route_payload(route) -> Dict:
+    path, cost = route
+    return {"path": path, "cost": cost}
+
+
+class RouteServer:
+    def __init__(self, engine: RoutingEngine, response_cache_size: int = RESPONSE_CACHE_SIZE):
+        self.engine = engine
+        # The engine is not thread-safe, so every search goes through one thread
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="route")
+        self._in_flight: Dict[Tuple, asyncio.Future] = {}
+        self._responses: "OrderedDict[Tuple, Response]" = OrderedDict()
+        self._response_cache_size = response_cache_size
+        self._server: Optional[asyncio.AbstractServer] = None
+        # Only what was built before serving: building a hierarchy or table on
+        # demand would hold up every other search for minutes
+        self._route_methods = {"auto", "astar", "dijkstra"}
+        if engine.hierarchy is not None:
+            self._route_methods.add("ch")
+        if engine.all_pairs is not None:
+            self._route_methods.add("table")
+        self._endpoints = {
+            "/route": ("GET", self.route),
+            "/nearest": ("GET", self.nearest),
+            "/batch": ("POST", self.batch),
+            "/metrics": ("GET", self.metrics),
+        }
+
+    async def start(self, host: str = "127.0.0.1", port: int = DEFAULT_PORT) -> asyncio.AbstractServer:
+        self._server = await asyncio.start_server(self._serve_connection, host, port)
+        return self._server
+
+    async def close(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        self._executor.shutdown(wait=True)
+
+    async def _serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), KEEP_ALIVE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    break
+                started = time.perf_counter()
+                try:
+                    method, target, keep_alive, body = await self._read_request(head, reader)
+                except HTTPError as exc:
+                    # The stream may be mid-request, so answer and hang up
+                    await self._respond(writer, json_response({"error": str(exc)}, exc.status), False)
+                    break
+                endpoint, response = await self._dispatch(method, target, body)
+                await self._respond(writer, response, keep_alive)
+                metrics.observe(f"http_{endpoint}", time.perf_counter() - started)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            pass  # Client went away, possibly mid-request, or sent an oversized head
+        finally:
+            writer.close()
+
+    async def _read_request(self, head: bytes, reader: asyncio.StreamReader):
+        request_line, *lines = head[:-4].decode("latin-1").split("\r\n")
+        try:
+            method, target, version = request_line.split()
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Malformed request line") from None
+        if len(lines) > MAX_HEADERS:
+            raise HTTPError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE)
+        headers = {}
+        for line in lines:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        connection = headers.get("connection", "").lower()
+        if version == "HTTP/1.1":
+            keep_alive = connection != "close"
+        else:
+            keep_alive = connection == "keep-alive"
+        if "chunked" in headers.get("transfer-encoding", "").lower():
+            raise HTTPError(HTTPStatus.LENGTH_REQUIRED, "Chunked request bodies are not supported")
+        try:
+            length = int(headers.get("content-length", 0))
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "Bad Content-Length") from None
+        if length > MAX_BODY_BYTES:
+            raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+        body = await reader.readexactly(length) if length > 0 else b""
+        return method.upper(), target, keep_alive, body
+
+    async def _respond(self, writer: asyncio.StreamWriter, response: Response, keep_alive: bool) -> None:
+        status, body, content_type = response
+        head = (f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                f"Content-Type: {content_type}; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+    async def _dispatch(self, method: str, target: str, body: bytes) -> Tuple[str, Response]:
+        url = urlsplit(target)
+        endpoint = self._endpoints.get(url.path)
+        name = url.path.strip("/") or "root"
+        metrics.count("http_requests")
+        try:
+            if endpoint is None:
+                name = "unknown"
+                raise HTTPError(HTTPStatus.NOT_FOUND, f"No endpoint {url.path}")
+            allowed, handler = endpoint
+            if method not in (allowed, "POST"):
+                raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED)
+            params = dict(parse_qsl(url.query))
+            if body:
+                try:
+                    document = json.loads(body)
+                except ValueError:
+                    raise HTTPError(HTTPStatus.BAD_REQUEST, "Body is not valid JSON") from None
+                if not isinstance(document, dict):
+                    raise HTTPError(HTTPStatus.BAD_REQUEST, "Body must be a JSON object")
+                params.update(document)
+            return name, await handler(params)
+        except HTTPError as exc:
+            status, message = exc.status, str(exc)
+        except (UnknownLocationError, NoRouteError) as exc:
+            status, message = HTTPStatus.NOT_FOUND, str(exc)
+        except (RoutingError, ValueError) as exc:
+            status, message = HTTPStatus.BAD_REQUEST, str(exc)
+        except Exception as exc:
+            status, message = HTTPStatus.INTERNAL_SERVER_ERROR, f"{type(exc).__name__}: {exc}"
+        metrics.count("http_errors")
+        return name, json_response({"error": message}, status)
+
+    async def _answer(self, key: Tuple, encode, function, *args) -> Response:
+        """encode(function(*args)) as JSON, run on the search thread at most once per key."""
+        response = self._responses.get(key)
+        if response is not None:
+            self._responses.move_to_end(key)
+            metrics.count("http_response_cache_hits")
+            return response
+        future = self._in_flight.get(key)
+        if future is not None:
+            metrics.count("http_coalesced")
+        else:
+            future = asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+            self._in_flight[key] = future
+            future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        # Shielded so one client hanging up does not cancel the others' answer
+        response = json_response(encode(await asyncio.shield(future)))
+        self._responses[key] = response
+        if len(self._responses) > self._response_cache_size:
+            self._responses.popitem(last=False)
+        return response
+
+    async def route(self, params: Dict) -> Response:
+        origin, destination = required(params, "origin"), required(params, "destination")
+        k = integer(params, "k", 1)
+        method = params.get("method", "auto")
+        allowed = self._route_methods | {"yen", "penalty"} if k > 1 else self._route_methods
+        if method not in allowed:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f"method must be one of: {', '.join(sorted(allowed))}")
+        profile, departure = optional(params, "profile"), number(params, "departure")
+        if k > 1:
+            key = ("alternatives", origin, destination, k, method, profile, departure)
+            return await self._answer(key, lambda routes: {"routes": [route_payload(route) for route in routes]},
+                                      self._alternatives, origin, destination, k, method, profile, departure)
+        key = ("route", origin, destination, method, profile, departure)
+        return await self._answer(key, route_payload, self._route, origin, destination, method, profile, departure)
+
+    async def nearest(self, params: Dict) -> Response:
+        origin, category = required(params, "origin"), required(params, "category")
+        profile, departure = optional(params, "profile"), number(params, "departure")
+        key = ("nearest", origin, category, profile, departure)
+        return await self._answer(key, lambda route: dict(route_payload(route), facility=route[0][-1]),
+                                  self._nearest, origin, category, profile, departure)
+
+    async def batch(self, params: Dict) -> Response:
+        pairs = params.get("pairs")
+        if not isinstance(pairs, list) or not all(isinstance(pair, list) and len(pair) == 2 for pair in pairs):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "pairs must be a list of [origin, destination]")
+        if len(pairs) > MAX_BATCH_PAIRS:
+            raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"At most {MAX_BATCH_PAIRS} pairs per batch")
+        profile, departure = optional(params, "profile"), number(params, "departure")
+        loop = asyncio.get_running_loop()
+        results = await loop.run_in_executor(self._executor, self._batch,
+                                             [(str(o), str(d)) for o, d in pairs], profile, departure)
+        return json_response({"results": [{"error": error} if error else {"path": path, "cost": cost}
+                                          for path, cost, error in results]})
+
+    async def metrics(self, params: Dict) -> Response:
+        if params.get("format") == "json":
+            return HTTPStatus.OK, metrics.to_json().encode("utf-8"), "application/json"
+        return HTTPStatus.OK, metrics.to_prometheus().encode("utf-8"), "text/plain; version=0.0.4"
+
+    # The methods below run on the search thread
+
+    def _route(self, origin, destination, method, profile, departure):
+        return self.engine.route(origin, destination, method, profile=profile, departure=departure)
+
+    def _alternatives(self, origin, destination, k, method, profile, departure):
+        # Route methods name single-route searches; alternatives pick their own
+        method = method if method in ("yen", "penalty") else "auto"
+        return self.engine.alternatives(origin, destination, k, method, profile=profile, departure=departure)
+
+    def _nearest(self, origin, category, profile, departure):
+        return nearest_facility(self.engine, origin, category, profile=profile, departure=departure)
+
+    def _batch(self, pairs, profile, departure):
+        costs = None if profile is None else self.engine.edge_costs(profile, departure)
+        return route_pairs(self.engine.frozen(), pairs, costs)
+
+
+def required(params: Dict, name: str) -> str:
+    value = params.get(name)
+    if value is None or value == "":
+        raise HTTPError(HTTPStatus.BAD_REQUEST, f"Missing parameter: {name}")
+    return str(value)
+
+
+def optional(params: Dict, name: str) -> Optional[str]:
+    value = params.get(name)
+    return None if value is None or value == "" else str(value)
+
+
+def integer(params: Dict, name: str, default: int) -> int:
+    try:
+        value = int(params.get(name, default))
+    except (TypeError, ValueError):
+        raise HTTPError(HTTPStatus.BAD_REQUEST, f"{name} must be an integer") from None
+    if value < 1:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, f"{name} must be at least 1")
+    return value
+
+
+def number(params: Dict, name: str) -> Optional[float]:
+    if params.get(name) in (None, ""):
+        return None
+    try:
+        return float(params[name])
+    except (TypeError, ValueError):
+        raise HTTPError(HTTPStatus.BAD_REQUEST, f"{name} must be a number") from None
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Serve campus routes over HTTP/JSON.")
+    parser.add_argument("--map", required=True, help="map file written by Save Map (.pfmap)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--precompute", choices=["auto", "none", "ch", "table"], default="auto",
+                        help="speed up plain route queries with all-pairs tables or a contraction hierarchy; "
+                             "auto (the default) uses tables when they fit, else a hierarchy saved as "
+                             f"<map>{HIERARCHY_SUFFIX}; ch builds and saves one, which large maps need "
+                             "for more than ~100 uncached requests per second")
+    parser.add_argument("--cache-size", type=int, default=4096, help="routes kept in the route cache")
+    return parser
+
+
+async def serve(server: RouteServer, host: str, port: int) -> None:
+    listener = await server.start(host, port)
+    address = ", ".join(str(sock.getsockname()) for sock in listener.sockets)
+    print(f"Serving routes on {address}", file=sys.stderr)
+    try:
+        await listener.serve_forever()
+    finally:
+        await server.close()
+
+
+def precompute(engine: RoutingEngine, mode: str, hierarchy_path: str) -> None:
+    if mode == "table":
+        try:
+            engine.precompute_all_pairs()
+        except MemoryBudgetError as exc:
+            sys.exit(f"Cannot precompute tables: {exc}")
+    elif mode == "ch":
+        print("Building contraction hierarchy...", file=sys.stderr)
+        try:
+            engine.build_hierarchy(hierarchy_path)
+        except OSError as exc:
+            print(f"Could not save {hierarchy_path}: {exc}", file=sys.stderr)
+    elif mode == "auto":
+        try:
+            engine.precompute_all_pairs()
+            return
+        except MemoryBudgetError:
+            pass
+        if os.path.exists(hierarchy_path):
+            engine.build_hierarchy(hierarchy_path)
+        else:
+            print(f"No {hierarchy_path}: uncached routes use A*, which is slow on large maps. "
+                  "Run once with --precompute ch to build and save a hierarchy.", file=sys.stderr)
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        engine = mapfile.load_map(args.map, cache_size=args.cache_size)
+    except (OSError, mapfile.MapFormatError) as exc:
+        sys.exit(f"Could not load map: {exc}")
+    precompute(engine, args.precompute, args.map + HIERARCHY_SUFFIX)
+    # Latency histograms back /metrics, so they are on whatever the environment says
+    metrics.enabled = True
+    try:
+        asyncio.run(serve(RouteServer(engine), args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
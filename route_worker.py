@@ -0,0 +1,110 @@
+"""Run route searches off the Tk thread.
+
+Tk widgets may only be touched from the thread running mainloop, so the
+worker thread never calls back into the UI directly. Finished results are
+picked up by polling with master.after and delivered on the Tk thread.
+Cancelling a job makes its search stop at the next progress report, and
+its result is discarded whatever the outcome. A table or hierarchy build
+that a search sets off cannot be interrupted; the search stops once it ends.
+"""
+import threading
+import tkinter as tk
+from concurrent.futures import ThreadPoolExecutor
+from tkinter import ttk
+
+from routing import RouteCancelled
+
+POLL_MS = 30
+
+
+class RouteJob:
+    def __init__(self, search, on_done, on_error, on_progress):
+        self.search = search
+        self.on_done = on_done
+        self.on_error = on_error
+        self.on_progress = on_progress
+        self.cancelled = threading.Event()
+        # Written by the worker thread, read when polling
+        self.settled = 0
+        self.future = None
+
+    def report(self, settled):
+        if self.cancelled.is_set():
+            raise RouteCancelled()
+        self.settled = settled
+
+    def run(self):
+        return self.search(progress=self.report)
+
+
+class RouteWorker:
+    def __init__(self, master):
+        self.master = master
+        # One thread: a new search queues behind a cancelled one only until
+        # that one reaches its next progress report
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="route")
+        self._job = None
+
+    @property
+    def busy(self):
+        return self._job is not None
+
+    def submit(self, search, on_done, on_error, on_progress=None):
+        """Run search(progress=...) in the background, cancelling any running one.
+
+        on_done(result), on_error(exc) for any exception the search raises
+        and on_progress(settled) are all called on the Tk thread.
+        """
+        self.cancel()
+        job = self._job = RouteJob(search, on_done, on_error, on_progress)
+        job.future = self._executor.submit(job.run)
+        self.master.after(POLL_MS, self._poll, job)
+        return job
+
+    def cancel(self):
+        if self._job is not None:
+            self._job.cancelled.set()
+            self._job = None
+
+    def shutdown(self):
+        self.cancel()
+        self._executor.shutdown(wait=False)
+
+    def _poll(self, job):
+        if job.cancelled.is_set():
+            return
+        if not job.future.done():
+            if job.on_progress is not None:
+                job.on_progress(job.settled)
+            self.master.after(POLL_MS, self._poll, job)
+            return
+        self._job = None
+        try:
+            result = job.future.result()
+        except Exception as exc:  # e.g. MemoryBudgetError, or the map edited mid-search
+            job.on_error(exc)
+        else:
+            job.on_done(result)
+
+
+class SearchIndicator:
+    """Progress bar and status line shown while a route search runs."""
+
+    def __init__(self, master):
+        self.status = tk.StringVar()
+        self.bar = ttk.Progressbar(master, mode='indeterminate', length=200)
+        self.label = tk.Label(master, textvariable=self.status)
+        self.bar.pack()
+        self.label.pack()
+
+    def start(self):
+        self.status.set("Searching...")
+        self.bar.start(15)
+
+    def update(self, settled):
+        if settled:
+            self.status.set(f"Searching... {settled:,} places checked")
+
+    def stop(self, message=""):
+        self.bar.stop()
+        self.status.set(message)
@@ -0,0 +1,527 @@
+"""Headless routing engine shared by the campus navigator apps.
+
+This module must stay importable without tkinter or matplotlib so it can be
+used from batch jobs and services that have no display.
+"""
+import functools
+import math
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Hashable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+import alternatives
+import cost_profiles
+from all_pairs import DEFAULT_MEMORY_BUDGET, AllPairsTable, MemoryBudgetError
+from contraction import ContractionHierarchy
+from cost_profiles import CostProfile, EdgeAttributes
+from csr_graph import CSRGraph, EdgeCosts, Progress
+from instrumentation import metrics
+from route_cache import RouteCache
+from spatial_index import SpatialIndex
+
+Node = Hashable
+Position = Tuple[float, float]
+Route = Tuple[List[Node], float]
+
+# Above this many alternatives, method="auto" switches from Yen to penalties
+YEN_MAX_K = 5
+# Cost arrays kept for this many (profile, hour) pairs, least recently used dropped first
+EDGE_COSTS_CACHE_SIZE = 8
+
+
+class RoutingError(Exception):
+    pass
+
+
+class UnknownLocationError(RoutingError):
+    def __init__(self, location):
+        super().__init__(f"Unknown location: {location}")
+        self.location = location
+
+
+class NoRouteError(RoutingError):
+    def __init__(self, start, end):
+        super().__init__(f"No route between {start} and {end}")
+        self.start = start
+        self.end = end
+
+
+class RouteCancelled(RoutingError):
+    def __init__(self):
+        super().__init__("Route search cancelled")
+
+
+def _serialized(method):
+    # The engine, its route cache and its all-pairs table are not thread-safe:
+    # searches run on a worker thread while the UI thread edits the map
+    @functools.wraps(method)
+    def locked(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return locked
+
+
+class RoutingEngine:
+    """Editable routing graph.
+
+    Searches and edits are serialized on one lock, so an edit made while a
+    search runs on another thread waits for it. A cancelled search lets go at
+    its next progress report.
+    """
+
+    def __init__(self, cache_size: int = 256):
+        # Re-entrant: searches may build the table or hierarchy they need
+        self._lock = threading.RLock()
+        # Undirected weighted graph stored as node -> {neighbour: weight}
+        self._adjacency: Dict[Node, Dict[Node, float]] = {}
+        # Materialized lazily for engines loaded from a frozen graph
+        self._positions: Optional[Dict[Node, Position]] = {}
+        # Query-side CSR snapshot, rebuilt lazily after the graph is edited
+        self._csr: Optional[CSRGraph] = None
+        self._hierarchy: Optional[ContractionHierarchy] = None
+        self._table: Optional[AllPairsTable] = None
+        self._table_stale = False
+        # Nearest-node lookup, rebuilt lazily after positions change
+        self._spatial: Optional[SpatialIndex] = None
+        # Edge attributes as node -> {neighbour: {name: value}}, shared by both directions
+        self._edge_attributes: Dict[Node, Dict[Node, Dict[str, object]]] = {}
+        # Attribute arrays and per-profile costs for the current CSR snapshot
+        self._attribute_arrays: Optional[EdgeAttributes] = None
+        self._edge_costs: "OrderedDict[Tuple[CostProfile, Optional[int]], EdgeCosts]" = OrderedDict()
+        self.cache = RouteCache(cache_size)
+
+    @classmethod
+    def from_csr(cls, csr: CSRGraph, cache_size: int = 256) -> "RoutingEngine":
+        """Wrap a frozen graph, such as a memory-mapped map file, without copying it.
+
+        The editable adjacency is only materialized on the first edit.
+        """
+        engine = cls(cache_size)
+        engine._adjacency = None
+        engine._csr = csr
+        engine._positions = None
+        return engine
+
+    @property
+    def positions(self) -> Dict[Node, Position]:
+        if self._positions is None:
+            csr = self._csr
+            self._positions = {}
+            if csr.coords is not None:
+                self._positions = {name: (x, y) for name, (x, y) in zip(csr.names, csr.coords.tolist())
+                                   if not (math.isnan(x) or math.isnan(y))}
+        return self._positions
+
+    def _thaw(self) -> None:
+        if self._adjacency is not None:
+            return
+        csr = self._csr
+        # Positions are read from the frozen graph, which edits are about to drop
+        self.positions
+        names = csr.names
+        offsets, neighbors, weights = csr.offsets.tolist(), csr.neighbors.tolist(), csr.weights.tolist()
+        adjacency = {}
+        for u, name in enumerate(names):
+            row = adjacency[name] = {}
+            for e in range(offsets[u], offsets[u + 1]):
+                v = names[neighbors[e]]
+                if weights[e] < row.get(v, float("inf")):
+                    row[v] = weights[e]
+        self._adjacency = adjacency
+
+    def _invalidate(self) -> None:
+        # The all-pairs table is not dropped here; add_node/add_edge keep it
+        # up to date incrementally
+        self._csr = None
+        self._hierarchy = None
+        self._attribute_arrays = None
+        self._edge_costs = OrderedDict()
+
+    def _move(self, node: Node, position: Position) -> None:
+        # Only coordinates changed: the edge arrays, and so the hierarchy and
+        # the all-pairs table, stay valid. A new snapshot is handed out because
+        # a search on another thread may still be reading the old one.
+        self._spatial = None
+        # Their A* heuristic scales were measured against the old coordinates
+        self._edge_costs = OrderedDict()
+        csr = self._csr
+        if csr is None:
+            return
+        coords = np.full((csr.node_count, 2), np.nan) if csr.coords is None else csr.coords.copy()
+        coords[csr.index[node]] = position
+        self._csr = CSRGraph(csr.names, csr.offsets, csr.neighbors, csr.weights, coords)
+        if self._table is not None:
+            self._table.csr = self._csr
+
+    @_serialized
+    def add_node(self, node: Node, position: Optional[Position] = None) -> None:
+        self._thaw()
+        if node not in self._adjacency:
+            self._adjacency[node] = {}
+            self._invalidate()
+            if self._table is not None:
+                self._grow_table()
+        if position is not None:
+            self.positions[node] = position
+            self._move(node, position)
+
+    @_serialized
+    def add_edge(self, u: Node, v: Node, weight: float) -> None:
+        if weight < 0:
+            raise ValueError("Edge weights must be non-negative")
+        self._thaw()
+        old_weight = self._adjacency.get(u, {}).get(v)
+        self.cache.invalidate_edge(u, v, old_weight, weight, self._distances_from)
+        self.add_node(u)
+        self.add_node(v)
+        self._adjacency[u][v] = weight
+        self._adjacency[v][u] = weight
+        self._invalidate()
+        if self._table is not None and weight != old_weight:
+            if old_weight is None or weight < old_weight:
+                # CSR ids follow node insertion order, so they match the table's
+                index = self.frozen().index
+                self._table.insert_edge(index[u], index[v], weight)
+            else:
+                # Heavier edges can lengthen routes anywhere; rebuild on next query
+                self._table_stale = True
+
+    def _grow_table(self) -> None:
+        try:
+            self._table.grow(len(self._adjacency))
+        except MemoryBudgetError:
+            self._table = None
+
+    def has_node(self, node: Node) -> bool:
+        if self._adjacency is None:
+            return node in self._csr.index
+        return node in self._adjacency
+
+    def nodes(self) -> List[Node]:
+        if self._adjacency is None:
+            return list(self._csr.names)
+        return list(self._adjacency)
+
+    def edges(self) -> Iterator[Tuple[Node, Node, float]]:
+        if self._adjacency is None:
+            csr = self._csr
+            offsets, neighbors, weights = csr.offsets.tolist(), csr.neighbors.tolist(), csr.weights.tolist()
+            for u in range(csr.node_count):
+                for e in range(offsets[u], offsets[u + 1]):
+                    if u < neighbors[e]:
+                        yield csr.names[u], csr.names[neighbors[e]], weights[e]
+            return
+        seen = set()
+        for u, neighbours in self._adjacency.items():
+            seen.add(u)
+            for v, weight in neighbours.items():
+                if v not in seen:
+                    yield u, v, weight
+
+    def neighbours(self, node: Node) -> Dict[Node, float]:
+        if self._adjacency is None:
+            csr = self._csr
+            u = csr.index[node]
+            lo, hi = int(csr.offsets[u]), int(csr.offsets[u + 1])
+            return {csr.names[v]: w for v, w in zip(csr.neighbors[lo:hi].tolist(), csr.weights[lo:hi].tolist())}
+        return self._adjacency[node]
+
+    @_serialized
+    def set_edge_attribute(self, u: Node, v: Node, name: str, value) -> None:
+        """Set stairs (bool), closed (bool) or crowding on an existing edge.
+
+        Crowding is a factor on the edge's weight: one number, or one per
+        hour of the day (see cost_profiles). Only routes asked for with a
+        profile see attributes, and the graph is not rebuilt.
+        """
+        if name not in cost_profiles.ATTRIBUTES:
+            raise ValueError(f"Unknown edge attribute: {name}")
+        if name == "crowding":
+            cost_profiles.crowding_pattern(value)
+        for node in (u, v):
+            if not self.has_node(node):
+                raise UnknownLocationError(node)
+        if v not in self.neighbours(u):
+            raise ValueError(f"No edge between {u} and {v}")
+        values = self._edge_attributes.setdefault(u, {}).get(v)
+        if values is None:
+            values = self._edge_attributes[u][v] = {}
+            self._edge_attributes.setdefault(v, {})[u] = values
+        values[name] = value
+        self._attribute_arrays = None
+        self._edge_costs = OrderedDict()
+
+    def edge_attributes(self, u: Node, v: Node) -> Dict[str, object]:
+        return dict(self._edge_attributes.get(u, {}).get(v, {}))
+
+    @_serialized
+    def edge_costs(self, profile, departure: Optional[float] = None) -> EdgeCosts:
+        """Edge costs under profile (a CostProfile or a PROFILES name) at a departure hour."""
+        if not isinstance(profile, CostProfile):
+            try:
+                profile = cost_profiles.PROFILES[profile]
+            except KeyError:
+                raise ValueError(f"Unknown cost profile: {profile}") from None
+        csr = self.frozen()
+        bucket = cost_profiles.time_bucket(departure)
+        # Held locally: an edit from another thread may swap these out meanwhile
+        cache = self._edge_costs
+        costs = cache.get((profile, bucket))
+        if costs is not None:
+            cache.move_to_end((profile, bucket))
+        else:
+            attributes = self._attribute_arrays
+            if attributes is None:
+                attributes = self._attribute_arrays = EdgeAttributes.build(csr, self._edge_attributes)
+            costs = EdgeCosts(csr, cost_profiles.edge_costs(csr.weights, attributes, profile, bucket))
+            if len(cache) >= EDGE_COSTS_CACHE_SIZE:
+                cache.popitem(last=False)
+            cache[profile, bucket] = costs
+        return costs
+
+    @_serialized
+    def frozen(self) -> CSRGraph:
+        if self._csr is None:
+            self._csr = CSRGraph.from_adjacency(self._adjacency, self.positions)
+            if self._table is not None:
+                self._table.csr = self._csr
+        return self._csr
+
+    def _distances_from(self, node: Node) -> Dict[Node, float]:
+        if not self.has_node(node):
+            return {node: 0.0}
+        csr = self.frozen()
+        dist, _ = csr.single_source(csr.index[node])
+        return {csr.names[i]: d for i, d in enumerate(dist) if d != float("inf")}
+
+    @_serialized
+    def snap(self, x: float, y: float, max_distance: float = math.inf) -> Optional[Node]:
+        """Nearest positioned node to (x, y), or None if none lies within max_distance."""
+        if self._spatial is None:
+            if self._positions is None:
+                # Frozen map: index the coordinate array without building the dict
+                csr = self._csr
+                self._spatial = SpatialIndex(csr.names, csr.coords if csr.coords is not None else [])
+            else:
+                self._spatial = SpatialIndex.from_positions(self._positions)
+        hit = self._spatial.nearest(x, y, max_distance)
+        return hit[0] if hit else None
+
+    @_serialized
+    def build_hierarchy(self, cache_path: Optional[str] = None) -> ContractionHierarchy:
+        """Preprocess the current graph into a contraction hierarchy.
+
+        With cache_path, a hierarchy saved for this exact graph is loaded
+        instead of rebuilt, and a freshly built one is written there.
+        """
+        csr = self.frozen()
+        if cache_path and os.path.exists(cache_path):
+            try:
+                self._hierarchy = ContractionHierarchy.load(cache_path, csr)
+                return self._hierarchy
+            except ValueError:
+                pass  # Stale or foreign file; rebuild below and overwrite it
+        self._hierarchy = ContractionHierarchy.build(csr)
+        if cache_path:
+            self._hierarchy.save(cache_path)
+        return self._hierarchy
+
+    @property
+    def hierarchy(self) -> Optional[ContractionHierarchy]:
+        return self._hierarchy
+
+    @_serialized
+    def precompute_all_pairs(self, memory_budget: int = DEFAULT_MEMORY_BUDGET,
+                             method: str = "auto") -> AllPairsTable:
+        """Build dense distance/next-hop tables so queries become table walks.
+
+        Raises all_pairs.MemoryBudgetError, leaving the engine unchanged, when
+        the tables would not fit in memory_budget bytes.
+        """
+        self._table = AllPairsTable.build(self.frozen(), memory_budget, method)
+        self._table_stale = False
+        return self._table
+
+    @property
+    def all_pairs(self) -> Optional[AllPairsTable]:
+        return self._table
+
+    @_serialized
+    def route(self, start: Node, end: Node, method: str = "auto", progress: Progress = None,
+              profile=None, departure: Optional[float] = None) -> Route:
+        """Shortest route as (path, cost).
+
+        method is "dijkstra", "astar", "ch", "table" or "auto". Auto prefers
+        the all-pairs table, then the contraction hierarchy, whichever has
+        been built for the current graph. Failing both, it uses A* whenever
+        the node coordinates give an admissible heuristic.
+
+        Dijkstra, A* and hierarchy searches call progress(settled)
+        periodically; it may raise RouteCancelled to abandon the search. A
+        table or hierarchy that has to be built first is built in one go:
+        progress is checked before the build starts but not during it.
+
+        With a cost profile (see edge_costs), costs follow the edge attributes
+        at the departure hour. Those routes are searched with Dijkstra or A*
+        and not cached, since the table and hierarchy hold plain weights.
+        A profile that leaves every weight as it is, e.g. the standard one
+        outside rush hours, is routed like no profile at all.
+        """
+        with metrics.capture("route"):
+            if self._costs(profile, departure) is not None:
+                return self._profile_route(start, end, method, progress, profile, departure)
+            return self._route(start, end, method, progress)
+
+    def _profile_route(self, start: Node, end: Node, method: str, progress: Progress,
+                       profile, departure: Optional[float]) -> Route:
+        with metrics.span("lookup"):
+            csr = self.frozen()
+            source = self._lookup(csr, start)
+            target = self._lookup(csr, end)
+            costs = self.edge_costs(profile, departure)
+        with metrics.span("search"):
+            if method == "dijkstra":
+                ids, cost = csr.shortest_path(source, target, progress, costs)
+            elif method in ("astar", "auto"):
+                ids, cost = csr.astar_path(source, target, progress, costs)
+            else:
+                raise ValueError(f"Routing method {method} cannot apply a cost profile")
+            metrics.count("nodes_settled", csr.last_settled)
+        if not ids:
+            metrics.count("routes_not_found")
+            raise NoRouteError(start, end)
+        metrics.count("routes_found")
+        return [csr.names[i] for i in ids], cost
+
+    def _route(self, start: Node, end: Node, method: str, progress: Progress) -> Route:
+        with metrics.span("lookup"):
+            csr = self.frozen()
+            source = self._lookup(csr, start)
+            target = self._lookup(csr, end)
+            cached = self.cache.get(start, end)
+        if cached is not None:
+            metrics.count("route_cache_hits")
+            return cached
+        with metrics.span("search"):
+            if method == "table" or (method == "auto" and self._table is not None):
+                if self._table is None or self._table_stale:
+                    if progress is not None:
+                        progress(0)
+                    budget = self._table.memory_budget if self._table else DEFAULT_MEMORY_BUDGET
+                    self.precompute_all_pairs(budget)
+                table = self._table
+                ids, cost = table.path(source, target)
+            elif method == "ch" or (method == "auto" and self._hierarchy is not None):
+                if self._hierarchy is None and progress is not None:
+                    progress(0)
+                hierarchy = self._hierarchy or self.build_hierarchy()
+                ids, cost = hierarchy.query(source, target, progress)
+                metrics.count("nodes_settled", hierarchy.last_settled)
+            elif method == "dijkstra":
+                ids, cost = csr.shortest_path(source, target, progress)
+                metrics.count("nodes_settled", csr.last_settled)
+            elif method in ("astar", "auto"):
+                # astar_path itself falls back to Dijkstra when the check fails
+                ids, cost = csr.astar_path(source, target, progress)
+                metrics.count("nodes_settled", csr.last_settled)
+            else:
+                raise ValueError(f"Unknown routing method: {method}")
+        if not ids:
+            metrics.count("routes_not_found")
+            raise NoRouteError(start, end)
+        with metrics.span("path"):
+            path = [csr.names[i] for i in ids]
+            # A search running off the UI thread may finish after the graph was
+            # edited; its answer is still returned but must not be cached
+            if self._csr is csr:
+                self.cache.put(start, end, path, cost)
+        metrics.count("routes_found")
+        return path, cost
+
+    @_serialized
+    def alternatives(self, start: Node, end: Node, k: int = 3, method: str = "auto",
+                     progress: Progress = None, profile=None,
+                     departure: Optional[float] = None) -> List[Route]:
+        """Up to k different routes, cheapest first.
+
+        method "yen" gives the exact k shortest loopless routes; "penalty"
+        runs a fixed number of searches and suits large k. "auto" uses Yen
+        up to YEN_MAX_K routes. profile and departure are as for route.
+        """
+        with metrics.capture("alternatives"):
+            csr = self.frozen()
+            source = self._lookup(csr, start)
+            target = self._lookup(csr, end)
+            costs = self._costs(profile, departure)
+            if method == "auto":
+                method = "yen" if k <= YEN_MAX_K else "penalty"
+            if method == "yen":
+                found = alternatives.k_shortest_paths(csr, source, target, k, progress, costs)
+            elif method == "penalty":
+                found = alternatives.penalty_paths(csr, source, target, k, progress=progress, costs=costs)
+            else:
+                raise ValueError(f"Unknown alternatives method: {method}")
+            if not found:
+                raise NoRouteError(start, end)
+            return [([csr.names[i] for i in ids], cost) for ids, cost in found]
+
+    @_serialized
+    def nearest(self, start: Node, candidates, progress: Progress = None,
+                profile=None, departure: Optional[float] = None) -> Route:
+        """Route from start to the closest of candidates, found by one search.
+
+        Raises NoRouteError when none of them can be reached.
+        """
+        with metrics.capture("nearest"):
+            csr = self.frozen()
+            source = self._lookup(csr, start)
+            targets = {self._lookup(csr, candidate) for candidate in candidates}
+            ids, cost = csr.nearest_of(source, targets, progress, self._costs(profile, departure))
+            metrics.count("nodes_settled", csr.last_settled)
+            if not ids:
+                raise NoRouteError(start, "any of the candidates")
+            return [csr.names[i] for i in ids], cost
+
+    @_serialized
+    def route_matrix(self, nodes: List[Node], progress: Progress = None, profile=None,
+                     departure: Optional[float] = None) -> Dict[Tuple[Node, Node], Route]:
+        """Shortest routes between every ordered pair of nodes that is connected.
+
+        Costs one early-terminating search per node but the last, since
+        routes run both ways on an undirected graph.
+        """
+        with metrics.capture("route_matrix"):
+            csr = self.frozen()
+            ids = [self._lookup(csr, node) for node in nodes]
+            costs = self._costs(profile, departure)
+            routes: Dict[Tuple[Node, Node], Route] = {}
+            for i, source in enumerate(ids):
+                routes[nodes[i], nodes[i]] = [nodes[i]], 0.0
+                later = ids[i + 1:]
+                if not later:
+                    break
+                dist, previous = csr.single_source(source, later, progress, costs)
+                for j, target in enumerate(later, i + 1):
+                    if dist[target] == float("inf"):
+                        continue
+                    path = [csr.names[k] for k in csr.unwind(previous, source, target)]
+                    routes[nodes[i], nodes[j]] = path, dist[target]
+                    routes[nodes[j], nodes[i]] = path[::-1], dist[target]
+            return routes
+
+    def _costs(self, profile, departure: Optional[float]) -> Optional[EdgeCosts]:
+        # None, for the plain-weight searches, when the profile changes nothing
+        if profile is None:
+            return None
+        costs = self.edge_costs(profile, departure)
+        return None if costs.weights is self.frozen().weights else costs
+
+    @staticmethod
+    def _lookup(csr: CSRGraph, location: Node) -> int:
+        try:
+            return csr.index[location]
+        except KeyError:
+            raise UnknownLocationError(location) from None
@@ -0,0 +1,83 @@
+"""Static 2-d KD-tree for nearest-node lookups.
+
+Used to resolve map clicks and to snap arbitrary positions, such as a kiosk
+location or a GPS fix, to the nearest routable node in O(log n) per query.
+"""
+import math
+from typing import Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+LEAF_SIZE = 16
+
+
+class SpatialIndex:
+    def __init__(self, names: Sequence[Hashable], coords):
+        coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+        known = np.flatnonzero(np.isfinite(coords).all(axis=1))
+        self._names = [names[i] for i in known.tolist()]
+        points = coords[known]
+
+        # Flat tree: each entry is (axis, split, left, right) for inner nodes
+        # or (-1, start, end, 0) for leaves over the reordered point lists
+        self._tree: List[Tuple[int, float, int, int]] = []
+        order = np.arange(len(points))
+        if len(points):
+            self._build(points, order, 0, len(points))
+        self._order = order
+        self._xs = points[order, 0].tolist()
+        self._ys = points[order, 1].tolist()
+
+    @classmethod
+    def from_positions(cls, positions: Dict[Hashable, Tuple[float, float]]) -> "SpatialIndex":
+        names = list(positions)
+        return cls(names, [positions[name] for name in names])
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def _build(self, points, order, start, end) -> int:
+        slot = len(self._tree)
+        if end - start <= LEAF_SIZE:
+            self._tree.append((-1, start, end, 0))
+            return slot
+        self._tree.append(None)
+        chunk = points[order[start:end]]
+        axis = int(np.argmax(chunk.max(axis=0) - chunk.min(axis=0)))
+        middle = (end - start) // 2
+        # Partial sort around the median keeps the build O(n log n)
+        partition = np.argpartition(chunk[:, axis], middle)
+        order[start:end] = order[start:end][partition]
+        split = float(points[order[start + middle], axis])
+        left = self._build(points, order, start, start + middle)
+        right = self._build(points, order, start + middle, end)
+        self._tree[slot] = (axis, split, left, right)
+        return slot
+
+    def nearest(self, x: float, y: float, max_distance: float = math.inf) -> Optional[Tuple[Hashable, float]]:
+        """Closest (name, distance) to (x, y), or None if nothing lies within max_distance."""
+        if not self._tree:
+            return None
+        tree, xs, ys = self._tree, self._xs, self._ys
+        best, best_sq = -1, max_distance * max_distance
+        # Stack of (node, squared distance from the query to that node's side)
+        stack = [(0, 0.0)]
+        while stack:
+            node, bound = stack.pop()
+            if bound > best_sq:
+                continue
+            axis, split, left, right = tree[node]
+            if axis < 0:
+                for i in range(split, left):
+                    d = (xs[i] - x) ** 2 + (ys[i] - y) ** 2
+                    if d <= best_sq:
+                        best, best_sq = i, d
+                continue
+            offset = (x if axis == 0 else y) - split
+            near, far = (left, right) if offset < 0 else (right, left)
+            # Visit the far side later, and only if it can still hold a closer point
+            stack.append((far, offset * offset))
+            stack.append((near, bound))
+        if best < 0:
+            return None
+        return self._names[int(self._order[best])], math.sqrt(best_sq)
@@ -0,0 +1,136 @@
+"""Reproducible synthetic campus maps for benchmarking.
+
+Every generator takes a node count and a seed and returns the same CSRGraph
+for the same arguments. Coordinates are set on every node, and each edge
+weighs at least its euclidean length, so A* has a usable heuristic. All
+three generators stay vectorized up to a few million nodes.
+
+    grid        jittered street grid, four-way junctions
+    geometric   random points joined to every neighbour within a radius
+    clustered   buildings of nearby rooms, each hung off an entrance, with
+                the entrances on a street grid
+"""
+import math
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+from csr_graph import CSRGraph
+
+# Average degree targeted by the geometric generator; well above the
+# percolation threshold, so nearly every node is in one component
+GEOMETRIC_DEGREE = 8
+# Rooms per building in the clustered generator
+BUILDING_SIZE = 40
+BUILDING_SPACING = 10.0
+# Edge weights are euclidean length times a factor drawn from this range
+DETOUR = (1.0, 1.5)
+
+SIZES = (10, 100, 1000, 10000, 100000, 1000000)
+
+
+def _names(n: int) -> List[str]:
+    return [f"n{i}" for i in range(n)]
+
+
+def _weighted(rng, coords, sources, targets, names) -> CSRGraph:
+    lengths = np.hypot(*(coords[sources] - coords[targets]).T)
+    weights = lengths * rng.uniform(*DETOUR, size=len(lengths))
+    return CSRGraph.from_edges(names, sources, targets, weights, coords)
+
+
+def _grid_edges(n: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    side = max(1, math.ceil(math.sqrt(n)))
+    ids = np.arange(n)
+    column, row = ids % side, ids // side
+    right = ids[(column < side - 1) & (ids + 1 < n)]
+    down = ids[ids + side < n]
+    cells = np.column_stack([column, row]).astype(float)
+    return cells, np.concatenate([right, down]), np.concatenate([right + 1, down + side])
+
+
+def grid(n: int, seed: int = 0) -> CSRGraph:
+    rng = np.random.default_rng(seed)
+    cells, sources, targets = _grid_edges(n)
+    coords = cells + rng.uniform(-0.25, 0.25, size=cells.shape)
+    return _weighted(rng, coords, sources, targets, _names(n))
+
+
+def _pairs_within(coords: np.ndarray, radius: float) -> Tuple[np.ndarray, np.ndarray]:
+    # Bucket points into radius-sized cells; a point's neighbours then lie in
+    # its own cell or one of the eight around it
+    cells = np.floor(coords / radius).astype(np.int64)
+    width, height = cells.max(axis=0) + 1
+    keys = cells[:, 0] * height + cells[:, 1]
+    order = np.argsort(keys, kind="stable")
+    starts = np.searchsorted(keys[order], np.arange(width * height), "left")
+    ends = np.searchsorted(keys[order], np.arange(width * height), "right")
+
+    sources, targets = [], []
+    # Same cell plus the four "forward" neighbours visits each cell pair once
+    for dx, dy in ((0, 0), (1, -1), (1, 0), (1, 1), (0, 1)):
+        cx, cy = cells[:, 0] + dx, cells[:, 1] + dy
+        inside = (cx < width) & (cy >= 0) & (cy < height)
+        points = np.flatnonzero(inside)
+        other = cx[inside] * height + cy[inside]
+        first, count = starts[other], ends[other] - starts[other]
+        i = np.repeat(points, count)
+        within = np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+        j = order[np.repeat(first, count) + within]
+        keep = np.hypot(*(coords[i] - coords[j]).T) <= radius
+        if (dx, dy) == (0, 0):
+            keep &= i < j
+        sources.append(i[keep])
+        targets.append(j[keep])
+    return np.concatenate(sources), np.concatenate(targets)
+
+
+def geometric(n: int, seed: int = 0) -> CSRGraph:
+    rng = np.random.default_rng(seed)
+    # Unit density, so the radius for a given average degree is size-independent
+    coords = rng.uniform(0, math.sqrt(n), size=(n, 2))
+    sources, targets = _pairs_within(coords, math.sqrt(GEOMETRIC_DEGREE / math.pi))
+    return _weighted(rng, coords, sources, targets, _names(n))
+
+
+def clustered(n: int, seed: int = 0) -> CSRGraph:
+    rng = np.random.default_rng(seed)
+    # Ids 0..buildings-1 are the entrances, the rest are rooms
+    buildings = max(1, n // BUILDING_SIZE)
+    cells, street_from, street_to = _grid_edges(buildings)
+    entrances = (cells + rng.uniform(-0.2, 0.2, size=cells.shape)) * BUILDING_SPACING
+    rooms = np.arange(buildings, n)
+    home = np.sort(rng.integers(0, buildings, size=len(rooms)))
+    coords = np.concatenate([entrances, entrances[home] + rng.normal(0, 1.0, size=(len(rooms), 2))])
+
+    # Every room opens onto its entrance; consecutive rooms of a building
+    # share a corridor
+    corridor = np.flatnonzero(home[1:] == home[:-1])
+    sources = np.concatenate([street_from, rooms, rooms[corridor]])
+    targets = np.concatenate([street_to, home, rooms[corridor + 1]])
+    return _weighted(rng, coords, sources, targets, _names(n))
+
+
+GENERATORS: Dict[str, Callable[[int, int], CSRGraph]] = {
+    "grid": grid,
+    "geometric": geometric,
+    "clustered": clustered,
+}
+
+
+def generate(kind: str, n: int, seed: int = 0) -> CSRGraph:
+    try:
+        generator = GENERATORS[kind]
+    except KeyError:
+        raise ValueError(f"Unknown map kind: {kind}") from None
+    return generator(n, seed)
+
+
+def random_pairs(csr: CSRGraph, count: int, seed: int = 0) -> List[Tuple[str, str]]:
+    """Seeded origin/destination pairs; distinct nodes whenever the map has two."""
+    rng = np.random.default_rng(seed)
+    n = csr.node_count
+    origins = rng.integers(0, n, size=count)
+    offsets = rng.integers(1, n, size=count) if n > 1 else np.zeros(count, dtype=np.int64)
+    destinations = (origins + offsets) % n
+    return [(csr.names[a], csr.names[b]) for a, b in zip(origins.tolist(), destinations.tolist())]